@@ -0,0 +1,125 @@
+"""
+Password hashing off the event loop.
+
+bcrypt is CPU-bound and holds the GIL, so hashing and verification run in a
+dedicated process pool sized to the machine's cores, started with the app.
+Workers come from a forkserver (spawn where that's unavailable) rather than a
+fork of the running event loop and its threads. The number of jobs that may
+wait for a worker is bounded; past that, callers get PasswordHasherBusy and
+should answer 503 with a Retry-After header.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "1"))
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+    def __init__(self, retry_after: int = HASH_RETRY_AFTER):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+# ---------------------------
+# WORKER FUNCTIONS (run in child processes)
+# ---------------------------
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:
+        # Not a bcrypt hash (e.g. a legacy plain-text value)
+        return False
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """Return the work factor encoded in a bcrypt hash, or None if unparsable"""
+    parts = hashed.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+# ---------------------------
+# HASHER
+# ---------------------------
+class PasswordHasher:
+    """Bounded process-pool executor for bcrypt"""
+
+    def __init__(
+        self,
+        workers: int = HASH_WORKERS,
+        max_pending: int = HASH_MAX_PENDING,
+        rounds: int = BCRYPT_ROUNDS,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        # Slots are released from the executor's callback thread
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Create the worker pool; called once at app startup"""
+        if self._executor is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(method),
+            )
+
+    def _release(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+
+    async def _submit(self, fn, *args):
+        if self._executor is None:
+            raise RuntimeError("PasswordHasher.start() was not called")
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PasswordHasherBusy()
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        # The slot is held until the job itself finishes (or is cancelled before
+        # it starts), not until the awaiting request goes away
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._submit(_verify, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True if the hash was made with a different work factor than configured"""
+        cost = hash_cost(hashed)
+        return cost is not None and cost != self.rounds
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
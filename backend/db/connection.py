@@ -0,0 +1,117 @@
+"""
+Pooled async Supabase data-access layer.
+
+All PostgREST traffic for a worker goes through one shared httpx client that
+keeps HTTP/2 connections alive, so endpoints can ``await`` queries instead of
+blocking a threadpool worker per round trip.
+"""
+
+import os
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+# Pool configuration (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_KEEPALIVE_CONNECTIONS = int(os.getenv("DB_KEEPALIVE_CONNECTIONS", str(DB_POOL_SIZE)))
+DB_KEEPALIVE_EXPIRY = float(os.getenv("DB_KEEPALIVE_EXPIRY", "30"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))
+DB_HTTP2 = os.getenv("DB_HTTP2", "1") != "0"
+
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    """PostgREST client whose session uses our connection pool settings"""
+
+    def __init__(self, *args, pool_size: int = DB_POOL_SIZE, **kwargs):
+        self._pool_size = pool_size
+        super().__init__(*args, **kwargs)
+
+    def create_session(self, base_url, headers, timeout, verify=True, *args, **kwargs):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            http2=DB_HTTP2,
+            limits=httpx.Limits(
+                max_connections=self._pool_size,
+                max_keepalive_connections=min(DB_KEEPALIVE_CONNECTIONS, self._pool_size),
+                keepalive_expiry=DB_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+
+class Database:
+    """Async access to Supabase tables over a shared, pooled HTTP client"""
+
+    def __init__(self, url: str, key: str, pool_size: int = DB_POOL_SIZE, timeout: float = DB_TIMEOUT):
+        self._client = _PooledPostgrestClient(
+            f"{url.rstrip('/')}/rest/v1",
+            headers={
+                **DEFAULT_POSTGREST_CLIENT_HEADERS,
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+            },
+            timeout=timeout,
+            pool_size=pool_size,
+        )
+
+    def table(self, name: str):
+        """Start a query on a table; finish it with ``await ... .execute()``"""
+        return self._client.from_(name)
+
+    def rpc(self, function: str, params: Optional[dict] = None):
+        """Call a Postgres function; finish it with ``await ... .execute()``"""
+        return self._client.rpc(function, params or {})
+
+    async def fetch_all(self, build_query, page_size: int = 1000) -> list:
+        """Run a query page by page (PostgREST caps rows per response) and return every row
+
+        ``build_query`` must return a fresh, ordered query builder on each call.
+        """
+        rows = []
+        start = 0
+        while True:
+            response = await build_query().range(start, start + page_size - 1).execute()
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            start += page_size
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_database: Optional[Database] = None
+
+
+def get_database() -> Database:
+    """Return the process-wide Database, creating it on first use"""
+    global _database
+    if _database is None:
+        if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+            raise RuntimeError("Supabase environment variables not set")
+        _database = Database(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    return _database
+
+
+async def close_database():
+    """Release pooled connections (call on application shutdown)"""
+    global _database
+    if _database is not None:
+        await _database.close()
+        _database = None
+
+
+async def get_db() -> Database:
+    """FastAPI dependency providing the pooled Database"""
+    return get_database()
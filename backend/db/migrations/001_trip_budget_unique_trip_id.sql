@@ -0,0 +1,16 @@
+-- One budget row per trip, required by the upsert in PUT /api/trips/{trip_id}/budget.
+-- Drop duplicates created by earlier concurrent PUTs, keeping the row stored last on
+-- disk (highest ctid). ctid order is physical, so that is usually, but not always,
+-- the most recently written row.
+DELETE FROM trip_budget a
+USING trip_budget b
+WHERE a.trip_id = b.trip_id
+  AND a.ctid < b.ctid;
+
+ALTER TABLE trip_budget
+    ADD CONSTRAINT trip_budget_trip_id_key UNIQUE (trip_id);
+
+-- The upsert leaves id out, so an update never rewrites an existing row's key
+-- and an insert needs a default.
+ALTER TABLE trip_budget
+    ALTER COLUMN id SET DEFAULT gen_random_uuid();
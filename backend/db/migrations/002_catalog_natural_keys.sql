@@ -0,0 +1,14 @@
+-- Natural keys used by the idempotent bulk loader in seed_database.py.
+ALTER TABLE cities
+    ADD CONSTRAINT cities_city_name_country_key UNIQUE (city_name, country);
+
+ALTER TABLE activities
+    ADD CONSTRAINT activities_city_id_act_name_key UNIQUE (city_id, act_name);
+
+-- The loader leaves id out of its upserts, so re-loading a row never rewrites
+-- its primary key and new rows need a default.
+ALTER TABLE cities
+    ALTER COLUMN id SET DEFAULT gen_random_uuid();
+
+ALTER TABLE activities
+    ALTER COLUMN id SET DEFAULT gen_random_uuid();
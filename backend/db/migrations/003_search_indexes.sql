@@ -0,0 +1,113 @@
+-- Indexed search for GET /api/activities and GET /api/cities (mode=indexed).
+-- Full-text vectors are expression indexes, so table rows (and select *) are unchanged.
+-- Every field uses the 'simple' config, the same one prefix_tsquery builds queries with;
+-- stemmed ('english') lexemes would not match unstemmed query prefixes.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION activity_search_vector(act_name text, category text, description text)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(act_name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(category, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+$$;
+
+CREATE OR REPLACE FUNCTION city_search_vector(city_name text, country text)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(city_name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(country, '')), 'B')
+$$;
+
+-- 'paris tow' -> 'paris':* & 'tow':*  (prefix matching on every word)
+CREATE OR REPLACE FUNCTION prefix_tsquery(query text)
+RETURNS tsquery
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT to_tsquery('simple', coalesce(string_agg(quote_literal(word) || ':*', ' & '), ''))
+    FROM regexp_split_to_table(lower(trim(query)), '[^[:alnum:]]+') AS word
+    WHERE word <> ''
+$$;
+
+CREATE INDEX IF NOT EXISTS activities_search_vector_idx
+    ON activities USING gin (activity_search_vector(act_name, category, description));
+CREATE INDEX IF NOT EXISTS activities_act_name_trgm_idx
+    ON activities USING gin (act_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS activities_category_trgm_idx
+    ON activities USING gin (category gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS cities_search_vector_idx
+    ON cities USING gin (city_search_vector(city_name, country));
+CREATE INDEX IF NOT EXISTS cities_city_name_trgm_idx
+    ON cities USING gin (city_name gin_trgm_ops);
+
+-- Ranked, typo-tolerant activity search with keyset pagination on (rank desc, id asc).
+-- Each row is the activity as JSON (with its city name/country embedded) plus its rank.
+CREATE OR REPLACE FUNCTION search_activities_ranked(
+    p_query text,
+    p_category text DEFAULT NULL,
+    p_city_id uuid DEFAULT NULL,
+    p_after_rank numeric DEFAULT NULL,
+    p_after_id uuid DEFAULT NULL,
+    p_limit int DEFAULT 50
+)
+RETURNS TABLE (activity jsonb, rank numeric)
+LANGUAGE sql STABLE AS $$
+    WITH matches AS (
+        SELECT a.*,
+               round((
+                   ts_rank_cd(activity_search_vector(a.act_name, a.category, a.description), prefix_tsquery(p_query))
+                   + greatest(similarity(a.act_name, p_query), similarity(coalesce(a.category, ''), p_query))
+               )::numeric, 6) AS search_rank
+        FROM activities a
+        WHERE (
+                activity_search_vector(a.act_name, a.category, a.description) @@ prefix_tsquery(p_query)
+                OR a.act_name % p_query
+                OR a.category % p_query
+              )
+          AND (p_category IS NULL OR a.category = p_category)
+          AND (p_city_id IS NULL OR a.city_id = p_city_id)
+    )
+    SELECT to_jsonb(m) - 'search_rank'
+               || jsonb_build_object('cities', jsonb_build_object('city_name', c.city_name, 'country', c.country)),
+           m.search_rank
+    FROM matches m
+    LEFT JOIN cities c ON c.id = m.city_id
+    WHERE p_after_rank IS NULL
+       OR m.search_rank < p_after_rank
+       OR (m.search_rank = p_after_rank AND m.id > p_after_id)
+    ORDER BY m.search_rank DESC, m.id ASC
+    LIMIT p_limit
+$$;
+
+CREATE OR REPLACE FUNCTION search_cities_ranked(
+    p_query text,
+    p_country text DEFAULT NULL,
+    p_after_rank numeric DEFAULT NULL,
+    p_after_id uuid DEFAULT NULL,
+    p_limit int DEFAULT 50
+)
+RETURNS TABLE (city jsonb, rank numeric)
+LANGUAGE sql STABLE AS $$
+    WITH matches AS (
+        SELECT c.*,
+               round((
+                   ts_rank_cd(city_search_vector(c.city_name, c.country), prefix_tsquery(p_query))
+                   + similarity(c.city_name, p_query)
+               )::numeric, 6) AS search_rank
+        FROM cities c
+        WHERE (
+                city_search_vector(c.city_name, c.country) @@ prefix_tsquery(p_query)
+                OR c.city_name % p_query
+              )
+          AND c.is_blacklisted = false
+          AND (p_country IS NULL OR c.country = p_country)
+    )
+    SELECT to_jsonb(m) - 'search_rank', m.search_rank
+    FROM matches m
+    WHERE p_after_rank IS NULL
+       OR m.search_rank < p_after_rank
+       OR (m.search_rank = p_after_rank AND m.id > p_after_id)
+    ORDER BY m.search_rank DESC, m.id ASC
+    LIMIT p_limit
+$$;
@@ -1,26 +1,61 @@
 import os
 import uuid
-from datetime import date, datetime, timedelta, time
+import asyncio
+from datetime import date
 from typing import Optional, List, Dict, Any
-from fastapi import FastAPI, HTTPException, Header, Query
+from fastapi import FastAPI, HTTPException, Header, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, EmailStr
-from supabase import create_client
 from dotenv import load_dotenv
-import bcrypt
-import random
+from db.connection import get_database, close_database
+from middleware.http_cache import HTTPCacheMiddleware
+from auth_services.hashing import password_hasher, PasswordHasherBusy
+from services import catalog, users, trips, schedule, snapshots, singleflight, typeahead, geo, routing, search as catalog_search
+from services.cache import cache_stats, start_cache, close_cache
+from services.pagination import decode_cursor, split_page, keyset_filter
+from services.recommend import invalidate_recommender
+from routes.recommendations import recommend_router
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+# Pooled async Supabase access shared by every request in this worker
+db = get_database()
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("Supabase environment variables not set")
+# orjson renders dates, UUIDs and dataclasses natively and is several times
+# faster than the stdlib encoder on the large nested trip payloads
+app = FastAPI(title="GlobeTrotter API", default_response_class=ORJSONResponse)
 
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+_background_tasks = []
 
-app = FastAPI(title="GlobeTrotter API")
+@app.on_event("startup")
+async def startup():
+    password_hasher.start()
+    await start_cache()
+    if typeahead.TYPEAHEAD_ENABLED:
+        _background_tasks.append(asyncio.create_task(typeahead.run_refresher(db)))
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    await close_database()
+    await close_cache()
+    password_hasher.shutdown()
+
+# ETags, 304s and compression for the large, frequently repeated reads.
+# Added before CORS so CORS headers also decorate 304 responses.
+app.add_middleware(
+    HTTPCacheMiddleware,
+    paths=[
+        r"/api/cities",
+        r"/api/cities/[^/]+/activities",
+        r"/api/trips/[^/]+/stops",
+        r"/api/trips/[^/]+/schedule",
+        r"/api/public/trips",
+        r"/api/public/trips/[^/]+",
+    ],
+)
 
 # CORS Configuration
 app.add_middleware(
@@ -31,6 +66,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(recommend_router)
+
 # ==================== SCHEMAS ====================
 
 class SignupRequest(BaseModel):
@@ -111,33 +148,98 @@ class BudgetUpdate(BaseModel):
 
 # ==================== HELPER FUNCTIONS ====================
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# Deadline for loading a trip schedule's suggestion candidates
+SCHEDULE_DEADLINE_SECONDS = float(os.getenv("SCHEDULE_DEADLINE_SECONDS", "10"))
+
+# Default search mode for /api/cities and /api/activities: "basic" (ilike) or "indexed"
+SEARCH_MODE = os.getenv("SEARCH_MODE", "basic")
+
+def hashing_unavailable(exc: PasswordHasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server busy, please retry shortly",
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy as e:
+        raise hashing_unavailable(e)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy as e:
+        raise hashing_unavailable(e)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+async def rehash_password(user_id: str, plain_password: str):
+    """Re-hash a password with the current work factor (best effort, after login)"""
+    try:
+        new_hash = await password_hasher.hash(plain_password)
+        await db.table("users").update({"password_hash": new_hash}).eq("id", user_id).execute()
+    except Exception as e:
+        print(f"Error rehashing password: {str(e)}")
 
-def get_user_by_id(user_id: str):
-    response = supabase.table("users").select("*").eq("id", user_id).single().execute()
+async def get_user_by_id(user_id: str):
+    response = await db.table("users").select("*").eq("id", user_id).single().execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="User not found")
     return response.data
 
-def serialize_dates(data: dict) -> dict:
-    """Convert date objects to ISO format strings"""
-    serialized = {}
-    for key, value in data.items():
-        if isinstance(value, date):
-            serialized[key] = value.isoformat()
+async def require_user(user_id: str) -> dict:
+    """Authorize an X-User-Id via the identity cache (no password_hash fetched)"""
+    identity = await users.get_user_identity(db, user_id)
+    if not identity:
+        raise HTTPException(status_code=404, detail="User not found")
+    return identity
+
+async def require_trip_owner(trip_id: str, user_id: str):
+    """404 unless the user owns the trip (served from the owned-trip cache when warm)"""
+    if not await trips.user_owns_trip(db, user_id, trip_id):
+        raise HTTPException(status_code=404, detail="Trip not found")
+
+def parse_cursor(cursor: Optional[str], *kinds: str) -> Optional[list]:
+    try:
+        return decode_cursor(cursor, *kinds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def get_activity_costs(activity_ids: List[str], cost_cache: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Look up avg_cost for many activities in a single query, reusing cached costs"""
+    costs = {}
+    missing = []
+    for activity_id in set(activity_ids):
+        if cost_cache is not None and activity_id in cost_cache:
+            costs[activity_id] = cost_cache[activity_id]
         else:
-            serialized[key] = value
-    return serialized
+            missing.append(activity_id)
+
+    if missing:
+        response = await db.table("activities").select("id, avg_cost").in_("id", missing).execute()
+        for activity in response.data or []:
+            cost = float(activity["avg_cost"]) if activity.get("avg_cost") else 0.0
+            costs[activity["id"]] = cost
+            if cost_cache is not None:
+                cost_cache[activity["id"]] = cost
 
-def calculate_estimated_budget(city_id: str, days: int, activities: List[str] = None) -> dict:
-    """Calculate estimated budget based on city cost index and selected activities"""
+    return costs
+
+async def calculate_estimated_budget(
+    city_id: str,
+    days: int,
+    activities: List[str] = None,
+    cost_cache: Optional[Dict[str, float]] = None
+) -> dict:
+    """Calculate estimated budget based on city cost index and selected activities
+
+    The city comes from the catalog cache and all activity costs are fetched
+    with at most one query. Pass a ``cost_cache`` dict to reuse activity costs
+    across calls.
+    """
     try:
-        city = supabase.table("cities").select("cost_index, city_name").eq("id", city_id).single().execute()
-        cost_index = city.data.get("cost_index", 50) if city.data else 50
+        city = await catalog.get_city(db, city_id)
+        cost_index = city.get("cost_index", 50) if city else 50
         
         base_transport_per_day = 20
         base_stay_per_day = 80
@@ -151,10 +253,8 @@ def calculate_estimated_budget(city_id: str, days: int, activities: List[str] =
         
         activity_cost = 0
         if activities:
-            for activity_id in activities:
-                activity = supabase.table("activities").select("avg_cost").eq("id", activity_id).single().execute()
-                if activity.data and activity.data.get("avg_cost"):
-                    activity_cost += float(activity.data["avg_cost"])
+            costs = await get_activity_costs(activities, cost_cache)
+            activity_cost = sum(costs.get(activity_id, 0.0) for activity_id in activities)
         else:
             activity_cost = 30 * days * multiplier
         
@@ -176,321 +276,43 @@ def calculate_estimated_budget(city_id: str, days: int, activities: List[str] =
             "days": days
         }
 
-def get_meal_recommendations(city_id: str, cost_index: int) -> Dict[str, Any]:
-    """Get meal recommendations based on city"""
-    multiplier = cost_index / 50.0
+def build_stop_schedule(
+    stop: Dict[str, Any],
+    city_data: Dict[str, Any],
+    template: Dict[str, Any],
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """Build the schedule entry for one trip stop"""
+    city_id = stop["city_id"]
+    cost_index = city_data.get("cost_index", 50)
     
-    meals = {
-        "breakfast": {
-            "name": "Local Breakfast Spot",
-            "type": "Breakfast",
-            "cost": round(10 * multiplier, 2),
-            "duration": 1.0,
-            "description": "Start your day with a traditional breakfast"
-        },
-        "lunch": {
-            "name": "Midday Dining",
-            "type": "Lunch",
-            "cost": round(20 * multiplier, 2),
-            "duration": 1.5,
-            "description": "Refuel with local cuisine"
-        },
-        "dinner": {
-            "name": "Evening Restaurant",
-            "type": "Dinner",
-            "cost": round(35 * multiplier, 2),
-            "duration": 2.0,
-            "description": "End your day with a delightful meal"
-        }
-    }
-    return meals
-
-def get_hotel_recommendation(city_id: str, cost_index: int) -> Dict[str, Any]:
-    """Get hotel recommendation based on city"""
-    multiplier = cost_index / 50.0
-    base_cost = 80 * multiplier
+    # Get selected activities for this stop (in a stable order, so the layout is too)
+    selected_activities = []
+    if stop.get("trip_activities"):
+        for trip_activity in sorted(stop["trip_activities"], key=lambda ta: ta.get("id") or ""):
+            if trip_activity.get("activities"):
+                selected_activities.append(trip_activity["activities"])
+    
+    # Generate smart schedule
+    stop_schedule, unscheduled = schedule.generate_smart_schedule(
+        stop_data=stop,
+        selected_activities=selected_activities,
+        city_id=city_id,
+        cost_index=cost_index,
+        template=template,
+        seed=seed
+    )
     
     return {
-        "name": "Recommended Hotel",
-        "type": "Accommodation",
-        "cost_per_night": round(base_cost, 2),
-        "check_in": "15:00",
-        "check_out": "11:00",
-        "description": "Comfortable stay in the heart of the city"
+        "stop_id": stop["id"],
+        "city_name": city_data.get("city_name", "Unknown"),
+        "country": city_data.get("country", ""),
+        "start_date": stop["start_date"],
+        "end_date": stop["end_date"],
+        "daily_schedules": stop_schedule,
+        "unscheduled_activities": unscheduled
     }
 
-def generate_smart_schedule(
-    stop_data: Dict[str, Any],
-    selected_activities: List[Dict[str, Any]],
-    city_id: str,
-    cost_index: int
-) -> List[Dict[str, Any]]:
-    """
-    Generate a smart daily schedule including:
-    - Selected activities
-    - Suggested additional activities
-    - Meals (breakfast, lunch, dinner)
-    - Hotel check-in/check-out
-    - Free time
-    """
-    
-    start_date = datetime.strptime(stop_data['start_date'], '%Y-%m-%d').date()
-    end_date = datetime.strptime(stop_data['end_date'], '%Y-%m-%d').date()
-    
-    # Get additional activity suggestions
-    try:
-        suggested_activities_response = supabase.table("activities").select("*").eq("city_id", city_id).limit(20).execute()
-        all_city_activities = suggested_activities_response.data or []
-        
-        # Filter out already selected activities
-        selected_ids = [act['id'] for act in selected_activities]
-        suggested_activities = [act for act in all_city_activities if act['id'] not in selected_ids]
-        random.shuffle(suggested_activities)
-    except:
-        suggested_activities = []
-    
-    # Get meal and hotel info
-    meals = get_meal_recommendations(city_id, cost_index)
-    hotel = get_hotel_recommendation(city_id, cost_index)
-    
-    daily_schedules = []
-    current_date = start_date
-    day_number = 1
-    
-    # Distribute selected activities across days
-    activities_per_day = {}
-    total_days = (end_date - start_date).days + 1
-    activities_to_distribute = selected_activities.copy()
-    
-    for day_offset in range(total_days):
-        day_date = start_date + timedelta(days=day_offset)
-        activities_per_day[day_date.isoformat()] = []
-    
-    # Distribute activities evenly
-    for idx, activity in enumerate(activities_to_distribute):
-        day_offset = idx % total_days
-        day_date = start_date + timedelta(days=day_offset)
-        activities_per_day[day_date.isoformat()].append(activity)
-    
-    # Build schedule for each day
-    while current_date <= end_date:
-        schedule_items = []
-        current_time = time(8, 0)  # Start day at 8 AM
-        
-        # Day 1: Hotel Check-in
-        if day_number == 1:
-            schedule_items.append({
-                "time": "15:00",
-                "type": "accommodation",
-                "title": hotel["name"],
-                "description": f"Check-in • {hotel['description']}",
-                "duration": 0.5,
-                "cost": hotel["cost_per_night"],
-                "is_selected": False,
-                "is_meal": False,
-                "is_hotel": True,
-                "icon": "🏨"
-            })
-        
-        # Breakfast
-        schedule_items.append({
-            "time": "08:00",
-            "type": "meal",
-            "title": meals["breakfast"]["name"],
-            "description": meals["breakfast"]["description"],
-            "duration": meals["breakfast"]["duration"],
-            "cost": meals["breakfast"]["cost"],
-            "is_selected": False,
-            "is_meal": True,
-            "is_hotel": False,
-            "icon": "🍳"
-        })
-        current_time = time(9, 0)
-        
-        # Morning Activities (9 AM - 12 PM)
-        day_activities = activities_per_day.get(current_date.isoformat(), [])
-        morning_activities = day_activities[:1] if day_activities else []
-        
-        for activity in morning_activities:
-            hour = current_time.hour
-            minute = current_time.minute
-            schedule_items.append({
-                "time": f"{hour:02d}:{minute:02d}",
-                "type": "activity",
-                "title": activity.get("act_name", "Activity"),
-                "description": activity.get("description", "Explore this attraction"),
-                "duration": activity.get("duration_hours", 2.0),
-                "cost": activity.get("avg_cost", 0),
-                "category": activity.get("category", "General"),
-                "is_selected": True,
-                "is_meal": False,
-                "is_hotel": False,
-                "icon": "🎯"
-            })
-            
-            # Advance time
-            duration_hours = int(activity.get("duration_hours", 2.0))
-            duration_minutes = int((activity.get("duration_hours", 2.0) % 1) * 60)
-            current_time = time(
-                (current_time.hour + duration_hours) % 24,
-                (current_time.minute + duration_minutes) % 60
-            )
-        
-        # Add a suggested activity if we have room before lunch
-        if current_time.hour < 12 and suggested_activities:
-            suggested = suggested_activities.pop(0)
-            schedule_items.append({
-                "time": f"{current_time.hour:02d}:{current_time.minute:02d}",
-                "type": "activity",
-                "title": f"💡 {suggested.get('act_name', 'Suggested Activity')}",
-                "description": f"Recommended: {suggested.get('description', 'Explore this attraction')}",
-                "duration": suggested.get("duration_hours", 1.5),
-                "cost": suggested.get("avg_cost", 0),
-                "category": suggested.get("category", "Suggested"),
-                "is_selected": False,
-                "is_meal": False,
-                "is_hotel": False,
-                "is_suggested": True,
-                "icon": "💡"
-            })
-            current_time = time(12, 0)
-        
-        # Lunch
-        schedule_items.append({
-            "time": "13:00",
-            "type": "meal",
-            "title": meals["lunch"]["name"],
-            "description": meals["lunch"]["description"],
-            "duration": meals["lunch"]["duration"],
-            "cost": meals["lunch"]["cost"],
-            "is_selected": False,
-            "is_meal": True,
-            "is_hotel": False,
-            "icon": "🍽️"
-        })
-        current_time = time(14, 30)
-        
-        # Afternoon Activities (2:30 PM - 6 PM)
-        afternoon_activities = day_activities[1:2] if len(day_activities) > 1 else []
-        
-        for activity in afternoon_activities:
-            hour = current_time.hour
-            minute = current_time.minute
-            schedule_items.append({
-                "time": f"{hour:02d}:{minute:02d}",
-                "type": "activity",
-                "title": activity.get("act_name", "Activity"),
-                "description": activity.get("description", "Explore this attraction"),
-                "duration": activity.get("duration_hours", 2.0),
-                "cost": activity.get("avg_cost", 0),
-                "category": activity.get("category", "General"),
-                "is_selected": True,
-                "is_meal": False,
-                "is_hotel": False,
-                "icon": "🎯"
-            })
-            
-            duration_hours = int(activity.get("duration_hours", 2.0))
-            duration_minutes = int((activity.get("duration_hours", 2.0) % 1) * 60)
-            current_time = time(
-                (current_time.hour + duration_hours) % 24,
-                (current_time.minute + duration_minutes) % 60
-            )
-        
-        # Free Time / Rest
-        if current_time.hour < 18:
-            schedule_items.append({
-                "time": f"{current_time.hour:02d}:{current_time.minute:02d}",
-                "type": "free_time",
-                "title": "Free Time",
-                "description": "Relax or explore at your own pace",
-                "duration": 1.5,
-                "cost": 0,
-                "is_selected": False,
-                "is_meal": False,
-                "is_hotel": False,
-                "icon": "⏰"
-            })
-        
-        # Dinner
-        schedule_items.append({
-            "time": "19:00",
-            "type": "meal",
-            "title": meals["dinner"]["name"],
-            "description": meals["dinner"]["description"],
-            "duration": meals["dinner"]["duration"],
-            "cost": meals["dinner"]["cost"],
-            "is_selected": False,
-            "is_meal": True,
-            "is_hotel": False,
-            "icon": "🍷"
-        })
-        
-        # Evening activity or rest
-        if len(day_activities) > 2:
-            evening_activity = day_activities[2]
-            schedule_items.append({
-                "time": "21:00",
-                "type": "activity",
-                "title": evening_activity.get("act_name", "Evening Activity"),
-                "description": evening_activity.get("description", "Evening exploration"),
-                "duration": evening_activity.get("duration_hours", 1.5),
-                "cost": evening_activity.get("avg_cost", 0),
-                "category": evening_activity.get("category", "General"),
-                "is_selected": True,
-                "is_meal": False,
-                "is_hotel": False,
-                "icon": "🌙"
-            })
-        else:
-            schedule_items.append({
-                "time": "21:00",
-                "type": "free_time",
-                "title": "Evening Leisure",
-                "description": "Unwind and prepare for tomorrow",
-                "duration": 1.0,
-                "cost": 0,
-                "is_selected": False,
-                "is_meal": False,
-                "is_hotel": False,
-                "icon": "🌙"
-            })
-        
-        # Last day: Check-out
-        if current_date == end_date:
-            schedule_items.insert(0, {
-                "time": "11:00",
-                "type": "accommodation",
-                "title": hotel["name"],
-                "description": "Check-out",
-                "duration": 0.5,
-                "cost": 0,
-                "is_selected": False,
-                "is_meal": False,
-                "is_hotel": True,
-                "icon": "🏨"
-            })
-        
-        # Sort schedule by time
-        schedule_items.sort(key=lambda x: x["time"])
-        
-        # Calculate daily total cost
-        daily_cost = sum(item.get("cost", 0) for item in schedule_items)
-        
-        daily_schedules.append({
-            "date": current_date.isoformat(),
-            "day_number": day_number,
-            "day_name": current_date.strftime("%A"),
-            "schedule": schedule_items,
-            "daily_cost": round(daily_cost, 2),
-            "total_activities": len([s for s in schedule_items if s["type"] == "activity"])
-        })
-        
-        current_date += timedelta(days=1)
-        day_number += 1
-    
-    return daily_schedules
-
 # ==================== AUTH ENDPOINTS ====================
 
 @app.get("/")
@@ -498,16 +320,16 @@ def root():
     return {"status": "GlobeTrotter API is running ✅", "version": "2.0"}
 
 @app.post("/api/auth/signup")
-def signup(payload: SignupRequest):
+async def signup(payload: SignupRequest):
     try:
-        existing = supabase.table("users").select("id").eq("email", payload.email).execute()
+        existing = await db.table("users").select("id").eq("email", payload.email).execute()
         if existing.data:
             raise HTTPException(status_code=400, detail="Email already registered")
 
         user_id = str(uuid.uuid4())
-        hashed_pw = hash_password(payload.password)
+        hashed_pw = await hash_password(payload.password)
 
-        supabase.table("users").insert({
+        await db.table("users").insert({
             "id": user_id,
             "first_name": payload.first_name,
             "last_name": payload.last_name,
@@ -519,6 +341,7 @@ def signup(payload: SignupRequest):
             "photo_url": payload.photo_url,
             "password_hash": hashed_pw
         }).execute()
+        await users.invalidate_user(user_id)
 
         return {"message": "User registered successfully", "user_id": user_id}
     except HTTPException:
@@ -527,14 +350,17 @@ def signup(payload: SignupRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/auth/login")
-def login(payload: LoginRequest):
+async def login(payload: LoginRequest, background_tasks: BackgroundTasks):
     try:
-        response = supabase.table("users").select("id, email, password_hash, first_name, last_name").eq("email", payload.email).single().execute()
+        response = await db.table("users").select("id, email, password_hash, first_name, last_name").eq("email", payload.email).single().execute()
         user = response.data
 
-        if not user or not verify_password(payload.password, user["password_hash"]):
+        if not user or not await verify_password(payload.password, user["password_hash"]):
             raise HTTPException(status_code=401, detail="Invalid email or password")
 
+        if password_hasher.needs_rehash(user["password_hash"]):
+            background_tasks.add_task(rehash_password, user["id"], payload.password)
+
         return {
             "message": "Login successful",
             "user_id": user["id"],
@@ -548,73 +374,105 @@ def login(payload: LoginRequest):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
 @app.get("/api/auth/me")
-def get_current_user(user_id: str = Header(..., alias="X-User-Id")):
-    user = get_user_by_id(user_id)
+async def get_current_user(user_id: str = Header(..., alias="X-User-Id")):
+    user = await get_user_by_id(user_id)
     user.pop("password_hash", None)
     return user
 
 @app.put("/api/auth/me")
-def update_current_user(payload: UserUpdate, user_id: str = Header(..., alias="X-User-Id")):
-    get_user_by_id(user_id)
+async def update_current_user(payload: UserUpdate, user_id: str = Header(..., alias="X-User-Id")):
+    await require_user(user_id)
     
     update_data = {k: v for k, v in payload.dict().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    supabase.table("users").update(update_data).eq("id", user_id).execute()
+    await db.table("users").update(update_data).eq("id", user_id).execute()
+    await users.invalidate_user(user_id)
     return {"message": "User updated successfully"}
 
 # ==================== CITIES ENDPOINTS ====================
 
 @app.get("/api/cities")
-def get_cities(
+async def get_cities(
     search: Optional[str] = Query(None),
     country: Optional[str] = Query(None),
-    limit: int = Query(50, le=100)
+    limit: int = Query(50, ge=1, le=100),
+    mode: str = Query(SEARCH_MODE, pattern="^(basic|indexed)$"),
+    cursor: Optional[str] = Query(None)
 ):
-    query = supabase.table("cities").select("*").eq("is_blacklisted", False)
+    if search and mode == "indexed":
+        try:
+            cities, next_cursor = await catalog_search.search_cities_indexed(db, search, country, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"cities": cities, "next_cursor": next_cursor}
     
-    if search:
-        query = query.ilike("city_name", f"%{search}%")
-    if country:
-        query = query.eq("country", country)
+    cities = await catalog.search_cities(db, search, country, limit)
+    return {"cities": cities}
+
+def with_distance(found) -> List[Dict[str, Any]]:
+    return [{**city, "distance_km": round(distance, 1)} for distance, city in found]
+
+@app.get("/api/cities/nearby")
+async def get_cities_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100),
+    radius_km: Optional[float] = Query(None, gt=0)
+):
+    """Closest cities to a point, optionally limited to radius_km"""
+    index = await geo.get_geo_index(db)
+    found = index.nearest(lat, lon, k, max_radius_km=radius_km or geo.MAX_DISTANCE_KM)
+    return {"cities": with_distance(found)}
+
+@app.get("/api/cities/{city_id}/nearby")
+async def get_next_stop_suggestions(
+    city_id: str,
+    radius_km: float = Query(500, gt=0),
+    k: int = Query(10, ge=1, le=100)
+):
+    """Next-stop suggestions: the closest other cities within radius_km"""
+    city = await catalog.get_city(db, city_id)
+    if not city:
+        raise HTTPException(status_code=404, detail="City not found")
+    if city.get("latitude") is None or city.get("longitude") is None:
+        raise HTTPException(status_code=400, detail="City has no coordinates")
     
-    response = query.limit(limit).execute()
-    return {"cities": response.data}
+    index = await geo.get_geo_index(db)
+    found = index.nearest(city["latitude"], city["longitude"], k, max_radius_km=radius_km, exclude_id=city_id)
+    return {"city_id": city_id, "cities": with_distance(found)}
 
 @app.get("/api/cities/{city_id}")
-def get_city(city_id: str):
-    response = supabase.table("cities").select("*").eq("id", city_id).single().execute()
-    if not response.data:
+async def get_city(city_id: str):
+    city = await catalog.get_city(db, city_id)
+    if not city:
         raise HTTPException(status_code=404, detail="City not found")
-    return response.data
+    return city
 
 @app.post("/api/cities")
-def create_city(payload: CityCreate, user_id: str = Header(..., alias="X-User-Id")):
-    get_user_by_id(user_id)
+async def create_city(payload: CityCreate, user_id: str = Header(..., alias="X-User-Id")):
+    await require_user(user_id)
     
     city_id = str(uuid.uuid4())
-    supabase.table("cities").insert({
-        "id": city_id,
-        **payload.dict()
-    }).execute()
+    city_data = {"id": city_id, **payload.dict()}
+    await db.table("cities").insert(city_data).execute()
+    await catalog.invalidate_cities(city_id)
+    geo.invalidate_geo_index()
+    if typeahead.TYPEAHEAD_ENABLED:
+        typeahead.index.add_city(city_data)
     
     return {"message": "City created successfully", "city_id": city_id}
 
 @app.get("/api/cities/{city_id}/activities")
-def get_city_activities(city_id: str, category: Optional[str] = Query(None)):
-    query = supabase.table("activities").select("*").eq("city_id", city_id)
-    
-    if category:
-        query = query.eq("category", category)
-    
-    response = query.execute()
-    return {"activities": response.data}
+async def get_city_activities(city_id: str, category: Optional[str] = Query(None)):
+    activities = await catalog.get_city_activities(db, city_id, category)
+    return {"activities": activities}
 
 # ==================== ACTIVITY RECOMMENDATIONS ====================
 
 @app.get("/api/cities/{city_id}/recommendations")
-def get_activity_recommendations(
+async def get_activity_recommendations(
     city_id: str,
     category: Optional[str] = Query(None),
     budget: Optional[str] = Query(None),
@@ -622,7 +480,7 @@ def get_activity_recommendations(
 ):
     """Get recommended activities for a city based on filters"""
     try:
-        query = supabase.table("activities").select("*").eq("city_id", city_id)
+        query = db.table("activities").select("*").eq("city_id", city_id)
         
         if category:
             query = query.eq("category", category)
@@ -635,9 +493,11 @@ def get_activity_recommendations(
             elif budget == "high":
                 query = query.gte("avg_cost", 100)
         
-        response = query.order("avg_cost", desc=False).limit(limit).execute()
+        # Identical concurrent requests share one query
+        response = await singleflight.execute(query.order("avg_cost", desc=False).limit(limit))
         
-        activities = response.data or []
+        # Rows are shared with coalesced requests; score copies of them
+        activities = [dict(activity) for activity in response.data or []]
         
         for activity in activities:
             score = 0
@@ -658,7 +518,7 @@ def get_activity_recommendations(
 # ==================== BUDGET ESTIMATION ====================
 
 @app.post("/api/budget/estimate")
-def estimate_budget(
+async def estimate_budget(
     city_id: str = Query(...),
     start_date: date = Query(...),
     end_date: date = Query(...),
@@ -671,7 +531,7 @@ def estimate_budget(
         if days < 1:
             raise HTTPException(status_code=400, detail="Invalid date range")
         
-        budget = calculate_estimated_budget(city_id, days, activity_ids)
+        budget = await calculate_estimated_budget(city_id, days, activity_ids)
         
         return {
             "city_id": city_id,
@@ -684,16 +544,42 @@ def estimate_budget(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ==================== TYPEAHEAD ====================
+
+@app.get("/api/typeahead")
+async def typeahead_search(
+    q: str = Query(..., min_length=1),
+    kind: Optional[str] = Query(None, pattern="^(city|activity)$"),
+    limit: int = Query(10, le=50)
+):
+    """Autocomplete over city and activity names from the in-process index"""
+    if not typeahead.TYPEAHEAD_ENABLED:
+        raise HTTPException(status_code=503, detail="Typeahead index is not enabled")
+    if typeahead.index.built_at is None:
+        raise HTTPException(status_code=503, detail="Typeahead index is still building")
+    return {"results": typeahead.index.search(q, kind, limit)}
+
 # ==================== ACTIVITIES ENDPOINTS ====================
 
 @app.get("/api/activities")
-def search_activities(
+async def search_activities(
     search: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     city_id: Optional[str] = Query(None),
-    limit: int = Query(50, le=100)
+    limit: int = Query(50, ge=1, le=100),
+    mode: str = Query(SEARCH_MODE, pattern="^(basic|indexed)$"),
+    cursor: Optional[str] = Query(None)
 ):
-    query = supabase.table("activities").select("*, cities(city_name, country)")
+    if search and mode == "indexed":
+        try:
+            activities, next_cursor = await catalog_search.search_activities_indexed(
+                db, search, category, city_id, limit, cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"activities": activities, "next_cursor": next_cursor}
+    
+    query = db.table("activities").select("*, cities(city_name, country)")
     
     if search:
         query = query.ilike("act_name", f"%{search}%")
@@ -702,35 +588,42 @@ def search_activities(
     if city_id:
         query = query.eq("city_id", city_id)
     
-    response = query.limit(limit).execute()
-    return {"activities": response.data}
+    after = parse_cursor(cursor, "uuid")
+    if after:
+        query = query.gt("id", after[0])
+    
+    response = await query.order("id").limit(limit + 1).execute()
+    activities, next_cursor = split_page(response.data or [], limit, "id")
+    return {"activities": activities, "next_cursor": next_cursor}
 
 @app.get("/api/activities/{activity_id}")
-def get_activity(activity_id: str):
-    response = supabase.table("activities").select("*, cities(city_name, country)").eq("id", activity_id).single().execute()
+async def get_activity(activity_id: str):
+    response = await db.table("activities").select("*, cities(city_name, country)").eq("id", activity_id).single().execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="Activity not found")
     return response.data
 
 @app.post("/api/activities")
-def create_activity(payload: ActivityCreate, user_id: str = Header(..., alias="X-User-Id")):
-    get_user_by_id(user_id)
+async def create_activity(payload: ActivityCreate, user_id: str = Header(..., alias="X-User-Id")):
+    await require_user(user_id)
     
     activity_id = str(uuid.uuid4())
-    supabase.table("activities").insert({
-        "id": activity_id,
-        **payload.dict()
-    }).execute()
+    activity_data = {"id": activity_id, **payload.dict()}
+    await db.table("activities").insert(activity_data).execute()
+    await schedule.invalidate_city_templates(payload.city_id)
+    invalidate_recommender()
+    if typeahead.TYPEAHEAD_ENABLED:
+        typeahead.index.add_activity(activity_data)
     
     return {"message": "Activity created successfully", "activity_id": activity_id}
 
 # ==================== TRIPS ENDPOINTS ====================
 
 @app.post("/api/trips")
-def create_trip(payload: TripCreate, user_id: str = Header(..., alias="X-User-Id")):
+async def create_trip(payload: TripCreate, user_id: str = Header(..., alias="X-User-Id")):
     """Create a new trip"""
     try:
-        get_user_by_id(user_id)
+        await require_user(user_id)
         
         trip_id = str(uuid.uuid4())
         
@@ -745,7 +638,8 @@ def create_trip(payload: TripCreate, user_id: str = Header(..., alias="X-User-Id
             "is_public": payload.is_public
         }
         
-        supabase.table("trips").insert(trip_data).execute()
+        await db.table("trips").insert(trip_data).execute()
+        trips.remember_trip(user_id, trip_id)
         
         return {"message": "Trip created successfully", "trip_id": trip_id}
         
@@ -755,13 +649,16 @@ def create_trip(payload: TripCreate, user_id: str = Header(..., alias="X-User-Id
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/trips")
-def get_all_trips(
+async def get_all_trips(
     user_id: str = Header(..., alias="X-User-Id"),
-    status: Optional[str] = Query(None)
+    status: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None)
 ):
-    """Get all trips for the authenticated user"""
+    """Get the authenticated user's trips, newest first, one keyset page at a time"""
     try:
-        query = supabase.table("trips").select("*").eq("user_id", user_id)
+        after = parse_cursor(cursor, "date", "uuid")
+        query = db.table("trips").select("*").eq("user_id", user_id)
         
         if status:
             if status == "ongoing":
@@ -774,17 +671,28 @@ def get_all_trips(
                 today = date.today().isoformat()
                 query = query.lt("end_date", today)
         
-        response = query.order("start_date", desc=True).execute()
-        return {"trips": response.data or []}
+        if after:
+            query = query.or_(keyset_filter("start_date", after[0], after[1]))
+        
+        response = await query.order("start_date", desc=True).order("id", desc=True).limit(limit + 1).execute()
+        user_trips, next_cursor = split_page(response.data or [], limit, "start_date", "id")
+        
+        # A complete, unfiltered listing is the user's full set of trip ids
+        if not status and not after and not next_cursor:
+            trips.set_owned_trips(user_id, (trip["id"] for trip in user_trips))
         
+        return {"trips": user_trips, "next_cursor": next_cursor}
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/trips/{trip_id}")
-def get_trip(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
+async def get_trip(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
     """Get a specific trip by ID"""
     try:
-        response = supabase.table("trips").select("*").eq("id", trip_id).eq("user_id", user_id).execute()
+        response = await db.table("trips").select("*").eq("id", trip_id).eq("user_id", user_id).execute()
         
         if not response.data or len(response.data) == 0:
             raise HTTPException(status_code=404, detail="Trip not found")
@@ -797,18 +705,13 @@ def get_trip(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/trips/{trip_id}")
-def update_trip(trip_id: str, payload: TripUpdate, user_id: str = Header(..., alias="X-User-Id")):
+async def update_trip(trip_id: str, payload: TripUpdate, user_id: str = Header(..., alias="X-User-Id")):
     """Update a trip"""
     """
 CONTINUATION OF main.py - Place this after the previous part
 """
 
     try:
-        trip = supabase.table("trips").select("id").eq("id", trip_id).eq("user_id", user_id).execute()
-        
-        if not trip.data or len(trip.data) == 0:
-            raise HTTPException(status_code=404, detail="Trip not found")
-        
         update_data = {k: v for k, v in payload.dict().items() if v is not None}
         
         if not update_data:
@@ -819,7 +722,12 @@ CONTINUATION OF main.py - Place this after the previous part
         if "end_date" in update_data:
             update_data["end_date"] = update_data["end_date"].isoformat()
         
-        supabase.table("trips").update(update_data).eq("id", trip_id).execute()
+        # Ownership is part of the filter; no row updated means not found
+        updated = await db.table("trips").update(update_data).eq("id", trip_id).eq("user_id", user_id).execute()
+        
+        if not updated.data:
+            raise HTTPException(status_code=404, detail="Trip not found")
+        await snapshots.invalidate_trip(trip_id)
         
         return {"message": "Trip updated successfully"}
         
@@ -829,13 +737,10 @@ CONTINUATION OF main.py - Place this after the previous part
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/trips/{trip_id}/stops")
-def create_trip_stop(trip_id: str, payload: TripStopCreate, user_id: str = Header(..., alias="X-User-Id")):
+async def create_trip_stop(trip_id: str, payload: TripStopCreate, user_id: str = Header(..., alias="X-User-Id")):
     """Create a new stop for a trip"""
     try:
-        trip = supabase.table("trips").select("id").eq("id", trip_id).eq("user_id", user_id).execute()
-        
-        if not trip.data or len(trip.data) == 0:
-            raise HTTPException(status_code=404, detail="Trip not found")
+        await require_trip_owner(trip_id, user_id)
         
         stop_id = str(uuid.uuid4())
         
@@ -848,7 +753,8 @@ def create_trip_stop(trip_id: str, payload: TripStopCreate, user_id: str = Heade
             "stop_order": payload.stop_order
         }
         
-        supabase.table("trip_stops").insert(stop_data).execute()
+        await db.table("trip_stops").insert(stop_data).execute()
+        await snapshots.invalidate_trip(trip_id)
         
         return {"message": "Trip stop created successfully", "stop_id": stop_id}
         
@@ -858,19 +764,17 @@ def create_trip_stop(trip_id: str, payload: TripStopCreate, user_id: str = Heade
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/trips/{trip_id}/stops")
-def get_trip_stops(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
+async def get_trip_stops(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
     """Get all stops for a trip"""
     try:
-        trip = supabase.table("trips").select("id").eq("id", trip_id).eq("user_id", user_id).execute()
-        
-        if not trip.data or len(trip.data) == 0:
-            raise HTTPException(status_code=404, detail="Trip not found")
+        await require_trip_owner(trip_id, user_id)
         
-        response = supabase.table("trip_stops").select(
+        response = await db.table("trip_stops").select(
             "*, cities(*), trip_activities(*, activities(*))"
         ).eq("trip_id", trip_id).order("stop_order").execute()
         
-        return {"stops": response.data or []}
+        # Plain JSON rows: skip the jsonable_encoder pass
+        return ORJSONResponse({"stops": response.data or []})
         
     except HTTPException:
         raise
@@ -878,8 +782,71 @@ def get_trip_stops(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
         print(f"Error getting trip stops: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/trips/{trip_id}/stops/optimize")
+async def optimize_trip_stops(
+    trip_id: str,
+    fix_start: bool = Query(True),
+    user_id: str = Header(..., alias="X-User-Id")
+):
+    """Suggest the shortest visiting order for a trip's stops (does not modify the trip)"""
+    try:
+        await require_trip_owner(trip_id, user_id)
+        
+        response = await db.table("trip_stops").select("id, city_id, stop_order").eq("trip_id", trip_id).order("stop_order").execute()
+        stops = response.data or []
+        cities = await catalog.get_cities_by_ids(db, [stop["city_id"] for stop in stops])
+        
+        # Stops whose city has no coordinates keep their relative order at the end
+        located = []
+        skipped = []
+        for stop in stops:
+            city = cities.get(stop["city_id"]) or {}
+            if city.get("latitude") is None or city.get("longitude") is None:
+                skipped.append(stop)
+            else:
+                located.append((stop, city))
+        
+        coords = [(city["latitude"], city["longitude"]) for _, city in located]
+        order, method = await asyncio.to_thread(routing.optimize_order, coords, fix_start)
+        
+        dist = routing.distance_matrix(coords) if coords else []
+        original_km = routing.path_length(range(len(coords)), dist)
+        optimized_km = routing.path_length(order, dist)
+        
+        optimized_stops = [located[i] for i in order] + [(stop, cities.get(stop["city_id"]) or {}) for stop in skipped]
+        
+        return {
+            "trip_id": trip_id,
+            "method": method,
+            "original_order": [stop["id"] for stop in stops],
+            "optimized_order": [
+                {
+                    "stop_id": stop["id"],
+                    "city_id": stop["city_id"],
+                    "city_name": city.get("city_name", "Unknown"),
+                    "current_stop_order": stop["stop_order"],
+                    "suggested_stop_order": position + 1
+                }
+                for position, (stop, city) in enumerate(optimized_stops)
+            ],
+            "skipped_stop_ids": [stop["id"] for stop in skipped],
+            "original_distance_km": round(original_km, 1),
+            "optimized_distance_km": round(optimized_km, 1),
+            "distance_saved_km": round(original_km - optimized_km, 1)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error optimizing trip stops: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/trips/{trip_id}/schedule")
-def get_trip_schedule(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
+async def get_trip_schedule(
+    trip_id: str,
+    reshuffle: Optional[int] = Query(None, ge=0),
+    user_id: str = Header(..., alias="X-User-Id")
+):
     """
     Get detailed daily schedule for a trip including:
     - Selected activities with timing
@@ -887,61 +854,88 @@ def get_trip_schedule(trip_id: str, user_id: str = Header(..., alias="X-User-Id"
     - Meals (breakfast, lunch, dinner)
     - Hotel check-in/check-out times
     - Free time slots
+
+    Suggestions are stable for a given trip and catalog; pass a different
+    reshuffle value to get another (equally stable) selection.
     """
     try:
-        # Verify trip belongs to user
-        trip = supabase.table("trips").select("*").eq("id", trip_id).eq("user_id", user_id).execute()
-        
-        if not trip.data or len(trip.data) == 0:
-            raise HTTPException(status_code=404, detail="Trip not found")
-        
-        trip_data = trip.data[0]
-        
-        # Get all stops with activities
-        stops_response = supabase.table("trip_stops").select(
-            "*, cities(*), trip_activities(*, activities(*))"
-        ).eq("trip_id", trip_id).order("stop_order").execute()
-        
-        stops = stops_response.data or []
-        
-        # Generate schedule for each stop
-        all_schedules = []
-        
-        for stop in stops:
-            city_id = stop["city_id"]
-            city_data = stop.get("cities", {})
-            cost_index = city_data.get("cost_index", 50)
+        reshuffle = reshuffle or 0
+        seen_writes = await snapshots.write_versions(trip_id)
+        
+        # Title and stop order come from the snapshot header when it is warm;
+        # otherwise one query reloads them and checks ownership
+        header = await snapshots.get_header(trip_id)
+        reloaded = header is None
+        if reloaded:
+            trip = await db.table("trips").select(
+                "title, trip_stops(id, stop_order)"
+            ).eq("id", trip_id).eq("user_id", user_id).execute()
             
-            # Get selected activities for this stop
-            selected_activities = []
-            if stop.get("trip_activities"):
-                for trip_activity in stop["trip_activities"]:
-                    if trip_activity.get("activities"):
-                        selected_activities.append(trip_activity["activities"])
+            if not trip.data or len(trip.data) == 0:
+                raise HTTPException(status_code=404, detail="Trip not found")
             
-            # Generate smart schedule
-            stop_schedule = generate_smart_schedule(
-                stop_data=stop,
-                selected_activities=selected_activities,
-                city_id=city_id,
-                cost_index=cost_index
-            )
+            trip_data = trip.data[0]
+            stop_rows = sorted(trip_data.get("trip_stops") or [], key=lambda s: (s.get("stop_order") or 0, s["id"]))
+            header = {"title": trip_data.get("title") or "Trip", "stop_ids": [s["id"] for s in stop_rows]}
+        else:
+            await require_trip_owner(trip_id, user_id)
+        
+        stop_ids = header["stop_ids"]
+        stop_schedules = await snapshots.get_stops(stop_ids, reshuffle)
+        missing = [stop_id for stop_id in stop_ids if stop_id not in stop_schedules]
+        
+        # Only stops without a valid snapshot are loaded and rebuilt
+        built = []
+        if missing and seen_writes is not None:
+            # Read before the stops load, so a write during the rebuild blocks storing it
+            stop_writes = await snapshots.write_versions(trip_id, missing)
+            seen_writes = None if stop_writes is None else {**stop_writes, **seen_writes}
+        if missing:
+            stops_response = await db.table("trip_stops").select(
+                "*, trip_activities(*, activities(*))"
+            ).in_("id", missing).execute()
             
-            all_schedules.append({
-                "stop_id": stop["id"],
-                "city_name": city_data.get("city_name", "Unknown"),
-                "country": city_data.get("country", ""),
-                "start_date": stop["start_date"],
-                "end_date": stop["end_date"],
-                "daily_schedules": stop_schedule
-            })
-        
-        return {
+            stops = stops_response.data or []
+            cities = await catalog.get_cities_by_ids(db, [stop["city_id"] for stop in stops])
+            
+            # One query loads capped suggestion pools for every distinct city in the rebuild
+            cost_indexes = {
+                stop["city_id"]: (cities.get(stop["city_id"]) or {}).get("cost_index", 50)
+                for stop in stops
+            }
+            city_versions = await schedule.activities_versions(list(cost_indexes))
+            try:
+                templates = await asyncio.wait_for(
+                    schedule.get_schedule_templates(db, cost_indexes),
+                    timeout=SCHEDULE_DEADLINE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail="Schedule generation timed out")
+            
+            for stop in stops:
+                stop_schedule = build_stop_schedule(
+                    stop,
+                    cities.get(stop["city_id"]) or {},
+                    templates[stop["city_id"]],
+                    seed=schedule.suggestion_seed(trip_id, stop["id"], city_versions[stop["city_id"]], reshuffle)
+                )
+                stop_schedules[stop["id"]] = stop_schedule
+                built.append((stop["id"], stop["city_id"], city_versions[stop["city_id"]], stop_schedule))
+        
+        # A stop deleted since the header was cached just drops out
+        all_schedules = [stop_schedules[stop_id] for stop_id in stop_ids if stop_id in stop_schedules]
+        if reloaded or missing:
+            live_ids = [stop_id for stop_id in stop_ids if stop_id in stop_schedules]
+            await snapshots.store(trip_id, header["title"], live_ids, built, reshuffle, seen_writes)
+        
+        # Schedule items are slotted dataclasses; orjson serializes them without an encoder pass
+        return ORJSONResponse({
             "trip_id": trip_id,
-            "trip_title": trip_data.get("title", "Trip"),
-            "total_stops": len(stops),
+            "trip_title": header["title"],
+            "total_stops": len(all_schedules),
+            "reshuffle": reshuffle,
             "schedules": all_schedules
-        }
+        })
         
     except HTTPException:
         raise
@@ -950,15 +944,12 @@ def get_trip_schedule(trip_id: str, user_id: str = Header(..., alias="X-User-Id"
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/trips/{trip_id}/budget")
-def get_trip_budget(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
+async def get_trip_budget(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
     """Get budget for a trip"""
     try:
-        trip = supabase.table("trips").select("id").eq("id", trip_id).eq("user_id", user_id).execute()
+        await require_trip_owner(trip_id, user_id)
         
-        if not trip.data or len(trip.data) == 0:
-            raise HTTPException(status_code=404, detail="Trip not found")
-        
-        response = supabase.table("trip_budget").select("*").eq("trip_id", trip_id).execute()
+        response = await db.table("trip_budget").select("*").eq("trip_id", trip_id).execute()
         
         if not response.data or len(response.data) == 0:
             return {
@@ -978,18 +969,13 @@ def get_trip_budget(trip_id: str, user_id: str = Header(..., alias="X-User-Id"))
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/trips/{trip_id}/budget")
-def update_trip_budget(trip_id: str, payload: BudgetUpdate, user_id: str = Header(..., alias="X-User-Id")):
+async def update_trip_budget(trip_id: str, payload: BudgetUpdate, user_id: str = Header(..., alias="X-User-Id")):
     """Update or create trip budget"""
     try:
         # Verify trip belongs to user
-        trip = supabase.table("trips").select("id").eq("id", trip_id).eq("user_id", user_id).execute()
-        
-        if not trip.data or len(trip.data) == 0:
-            raise HTTPException(status_code=404, detail="Trip not found")
-        
-        # Check if budget exists
-        existing_budget = supabase.table("trip_budget").select("*").eq("trip_id", trip_id).execute()
+        await require_trip_owner(trip_id, user_id)
         
+        # No id: new rows take the column default and existing rows keep theirs
         budget_data = {
             "trip_id": trip_id,
             "transport_cost": payload.transport_cost,
@@ -998,13 +984,8 @@ def update_trip_budget(trip_id: str, payload: BudgetUpdate, user_id: str = Heade
             "activity_cost": payload.activity_cost
         }
         
-        if existing_budget.data and len(existing_budget.data) > 0:
-            # Update existing
-            supabase.table("trip_budget").update(budget_data).eq("trip_id", trip_id).execute()
-        else:
-            # Create new
-            budget_data["id"] = str(uuid.uuid4())
-            supabase.table("trip_budget").insert(budget_data).execute()
+        # Single INSERT ... ON CONFLICT (trip_id) DO UPDATE, safe under concurrent edits
+        await db.table("trip_budget").upsert(budget_data, on_conflict="trip_id").execute()
         
         return {"message": "Budget updated successfully"}
         
@@ -1014,15 +995,15 @@ def update_trip_budget(trip_id: str, payload: BudgetUpdate, user_id: str = Heade
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/trips/{trip_id}")
-def delete_trip(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
+async def delete_trip(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
     """Delete a trip"""
     try:
-        trip = supabase.table("trips").select("id").eq("id", trip_id).eq("user_id", user_id).execute()
+        deleted = await db.table("trips").delete().eq("id", trip_id).eq("user_id", user_id).execute()
         
-        if not trip.data or len(trip.data) == 0:
+        if not deleted.data:
             raise HTTPException(status_code=404, detail="Trip not found")
-        
-        supabase.table("trips").delete().eq("id", trip_id).execute()
+        trips.forget_trip(user_id, trip_id)
+        await snapshots.drop_trip(trip_id)
         
         return {"message": "Trip deleted successfully"}
         
@@ -1034,7 +1015,7 @@ def delete_trip(trip_id: str, user_id: str = Header(..., alias="X-User-Id")):
 # ==================== TRIP ACTIVITIES ENDPOINTS ====================
 
 @app.post("/api/trip-activities")
-def create_trip_activity(payload: TripActivityCreate, user_id: str = Header(..., alias="X-User-Id")):
+async def create_trip_activity(payload: TripActivityCreate, user_id: str = Header(..., alias="X-User-Id")):
     """Add an activity to a trip stop"""
     try:
         activity_id = str(uuid.uuid4())
@@ -1047,7 +1028,8 @@ def create_trip_activity(payload: TripActivityCreate, user_id: str = Header(...,
             "estimated_cost": payload.estimated_cost
         }
         
-        supabase.table("trip_activities").insert(activity_data).execute()
+        await db.table("trip_activities").insert(activity_data).execute()
+        await snapshots.invalidate_stop(payload.trip_stop_id)
         
         return {"message": "Activity added to trip successfully", "activity_id": activity_id}
         
@@ -1055,10 +1037,12 @@ def create_trip_activity(payload: TripActivityCreate, user_id: str = Header(...,
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/trip-activities/{activity_id}")
-def delete_trip_activity(activity_id: str, user_id: str = Header(..., alias="X-User-Id")):
+async def delete_trip_activity(activity_id: str, user_id: str = Header(..., alias="X-User-Id")):
     """Remove an activity from a trip"""
     try:
-        supabase.table("trip_activities").delete().eq("id", activity_id).execute()
+        deleted = await db.table("trip_activities").delete().eq("id", activity_id).execute()
+        for row in deleted.data or []:
+            await snapshots.invalidate_stop(row["trip_stop_id"])
         
         return {"message": "Activity removed from trip successfully"}
         
@@ -1068,30 +1052,43 @@ def delete_trip_activity(activity_id: str, user_id: str = Header(..., alias="X-U
 # ==================== PUBLIC ENDPOINTS ====================
 
 @app.get("/api/public/trips")
-def get_public_trips(limit: int = Query(20, le=50)):
-    """Get all public trips"""
+async def get_public_trips(
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = Query(None)
+):
+    """Get public trips, newest first, one keyset page at a time"""
     try:
-        response = supabase.table("trips").select(
+        after = parse_cursor(cursor, "datetime", "uuid")
+        query = db.table("trips").select(
             "*, users(first_name, last_name, photo_url)"
-        ).eq("is_public", True).order("created_at", desc=True).limit(limit).execute()
+        ).eq("is_public", True)
+        
+        if after:
+            query = query.or_(keyset_filter("created_at", after[0], after[1]))
         
-        return {"trips": response.data or []}
+        response = await query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+        public_trips, next_cursor = split_page(response.data or [], limit, "created_at", "id")
         
+        return {"trips": public_trips, "next_cursor": next_cursor}
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/public/trips/{trip_id}")
-def get_public_trip(trip_id: str):
+async def get_public_trip(trip_id: str):
     """Get a specific public trip"""
     try:
-        response = supabase.table("trips").select(
+        # A popular trip opened by many users at once is fetched once
+        response = await singleflight.execute(db.table("trips").select(
             "*, users(first_name, last_name, photo_url), trip_stops(*, cities(*), trip_activities(*, activities(*)))"
-        ).eq("id", trip_id).eq("is_public", True).single().execute()
+        ).eq("id", trip_id).eq("is_public", True).single())
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Trip not found or is private")
         
-        return response.data
+        return ORJSONResponse(response.data)
         
     except HTTPException:
         raise
@@ -1109,6 +1106,11 @@ def health_check():
         "version": "2.0"
     }
 
+@app.get("/health/cache")
+def cache_health():
+    """Hit/miss counters for the in-process caches"""
+    return {"caches": cache_stats()}
+
 # ==================== MAIN ====================
 
 if __name__ == "__main__":
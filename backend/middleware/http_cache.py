@@ -0,0 +1,141 @@
+"""
+Validators and compression for cacheable read endpoints.
+
+Responses on the configured paths are buffered, tagged with a strong ETag
+(a hash of the body plus the content coding), answered with 304 when the
+client's If-None-Match already holds that tag, and otherwise compressed with
+brotli or gzip when large enough. Compressed bodies are cached by ETag, so a
+repeat full load of unchanged data does not compress again.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+from typing import Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from services.cache import TTLCache, MISSING
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+HTTP_COMPRESSED_CACHE_SIZE = int(os.getenv("HTTP_COMPRESSED_CACHE_SIZE", "256"))
+
+compressed_cache = TTLCache(maxsize=HTTP_COMPRESSED_CACHE_SIZE, ttl=600, name="compressed_responses")
+
+
+def accepted_encodings(header: Optional[str]) -> List[str]:
+    """Codings from an Accept-Encoding header, ignoring any with q=0"""
+    encodings = []
+    for part in (header or "").split(","):
+        coding, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            encodings.append(coding.lower())
+    return encodings
+
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    encodings = accepted_encodings(header)
+    if brotli is not None and "br" in encodings:
+        return "br"
+    if "gzip" in encodings or "*" in encodings:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=HTTP_GZIP_LEVEL)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class HTTPCacheMiddleware:
+    """ETag, conditional GET and compression for GET requests on matching paths"""
+
+    def __init__(self, app, paths: Iterable[str], minimum_size: int = HTTP_COMPRESS_MIN_BYTES):
+        self.app = app
+        self.paths = [re.compile(path) for path in paths]
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not any(path.fullmatch(scope["path"]) for path in self.paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        chunks = []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        body = b"".join(chunks)
+        headers = MutableHeaders(scope=start)
+
+        if start["status"] != 200 or "content-encoding" in headers:
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding")) if len(body) >= self.minimum_size else None
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+        headers["ETag"] = etag
+        headers.add_vary_header("Accept-Encoding")
+        if "cache-control" not in headers:
+            # Always revalidate; the ETag makes that a 304 when nothing changed.
+            # Per-user responses must not be stored by shared caches.
+            headers["Cache-Control"] = "private, no-cache" if "x-user-id" in request_headers else "no-cache"
+
+        if etag_matches(request_headers.get("if-none-match"), etag):
+            del headers["content-length"]
+            start["status"] = 304
+            await send(start)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if encoding:
+            compressed = compressed_cache.get(etag)
+            if compressed is MISSING:
+                compressed = compress(body, encoding)
+                compressed_cache.set(etag, compressed)
+            body = compressed
+            headers["Content-Encoding"] = encoding
+
+        headers["Content-Length"] = str(len(body))
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
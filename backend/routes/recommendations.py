@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from services.recommend import recommend_activities
 from db.connection import get_db
 
 recommend_router = APIRouter(prefix="/recommend", tags=["recommendations"])
 
 @recommend_router.get("/activities/{user_id}")
-def get_activity_recommendations(user_id: str, db=Depends(get_db)):
-    return recommend_activities(user_id, db)
+async def get_activity_recommendations(user_id: str, limit: int = Query(10, ge=1, le=50), db=Depends(get_db)):
+    return await recommend_activities(user_id, db, limit)
@@ -3,10 +3,15 @@ Database seeding script for GlobeTrotter
 Run this to populate your database with sample cities and activities
 """
 
+import argparse
+import csv
+import json
 import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from supabase import create_client
 from dotenv import load_dotenv
-import uuid
 
 load_dotenv()
 
@@ -297,37 +302,212 @@ def create_activities_for_city(city_id, city_name):
     
     return result
 
-def seed_database():
+# ==================== BULK LOADER ====================
+
+# Natural keys used for idempotent upserts (see db/migrations/002_catalog_natural_keys.sql)
+NATURAL_KEYS = {
+    "cities": ("city_name", "country"),
+    "activities": ("city_id", "act_name"),
+}
+
+NUMERIC_COLUMNS = {"cost_index", "popularity", "latitude", "longitude", "avg_cost", "duration_hours"}
+
+# (city_name, country) -> city id, filled as cities are loaded or looked up
+city_ids = {}
+
+
+def parse_csv_value(key, value):
+    if value == "":
+        return None
+    if key in NUMERIC_COLUMNS:
+        number = float(value)
+        return int(number) if number.is_integer() else number
+    return value
+
+
+def read_rows(path):
+    """Stream rows from a .csv or .jsonl file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {key: parse_csv_value(key, value) for key, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def natural_key(table, row):
+    return tuple(row[column] for column in NATURAL_KEYS[table])
+
+
+def fetch_all(build_query, page_size=1000):
+    """Run a query page by page (PostgREST caps rows per response) and return every row
+
+    ``build_query`` must return a fresh, ordered query builder on each call.
+    """
+    rows = []
+    start = 0
+    while True:
+        response = build_query().range(start, start + page_size - 1).execute()
+        page = response.data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+
+def resolve_activity_cities(batch):
+    """Replace city_name/country on activity rows with the matching city_id
+
+    Returns the resolved rows and the number dropped because their city wasn't found.
+    """
+    wanted = {
+        (row["city_name"], row["country"])
+        for row in batch
+        if not row.get("city_id") and (row["city_name"], row["country"]) not in city_ids
+    }
+    if wanted:
+        cities = fetch_all(
+            lambda: supabase.table("cities").select("id, city_name, country")
+            .in_("city_name", list({name for name, _ in wanted}))
+            .in_("country", list({country for _, country in wanted}))
+            .order("id")
+        )
+        for city in cities:
+            city_ids[(city["city_name"], city["country"])] = city["id"]
+
+    resolved = []
+    dropped = 0
+    for row in batch:
+        # Not activities columns, even when city_id is already given
+        city_key = (row.pop("city_name", None), row.pop("country", None))
+        if not row.get("city_id"):
+            city_id = city_ids.get(city_key)
+            if not city_id:
+                dropped += 1
+                continue
+            row["city_id"] = city_id
+        resolved.append(row)
+    return resolved, dropped
+
+
+def upsert_batch(table, batch):
+    """Idempotently write one batch; returns (rows written, rows dropped)"""
+    dropped = 0
+    if table == "activities":
+        batch, dropped = resolve_activity_cities(batch)
+
+    # Last row wins for duplicate keys inside a batch (ON CONFLICT can't touch a row twice)
+    rows = {natural_key(table, row): row for row in batch}
+    if not rows:
+        return 0, dropped
+
+    # No id in the payload: new rows take the column default and existing rows
+    # keep theirs, so foreign keys pointing at them stay valid
+    for row in rows.values():
+        row.pop("id", None)
+
+    response = supabase.table(table).upsert(
+        list(rows.values()),
+        on_conflict=",".join(NATURAL_KEYS[table])
+    ).execute()
+    if table == "cities":
+        for city in response.data or []:
+            city_ids[natural_key(table, city)] = city["id"]
+    return len(rows), dropped
+
+
+def bulk_load(table, rows, batch_size=500, workers=4):
+    """Upsert rows in batches on a pool of workers, printing throughput"""
+    started = time.perf_counter()
+    loaded = 0
+    dropped = 0
+    in_flight = set()
+
+    def report(done):
+        nonlocal loaded, dropped
+        for future in done:
+            written, skipped = future.result()
+            loaded += written
+            dropped += skipped
+        elapsed = time.perf_counter() - started
+        print(f"   … {table}: {loaded} rows ({loaded / elapsed:,.0f} rows/sec)", end="\r")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batched(rows, batch_size):
+            # Bound the number of queued batches so large files stream instead of loading fully
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                report(done)
+            in_flight.add(executor.submit(upsert_batch, table, batch))
+        done, _ = wait(in_flight)
+        report(done)
+
+    elapsed = time.perf_counter() - started
+    print(f"   ✓ {table}: {loaded} rows in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):,.0f} rows/sec)")
+    if dropped:
+        print(f"   ⚠ {table}: {dropped} rows skipped (city not found)")
+    return loaded
+
+
+def seed_database(batch_size=500, workers=4):
     """Seed the database with sample data"""
     
     print("🌍 Starting database seeding...")
     
-    # Insert cities
-    print("\n📍 Inserting cities...")
-    try:
-        for city in CITIES_DATA:
-            supabase.table("cities").insert(city).execute()
-            print(f"   ✓ Added {city['city_name']}, {city['country']}")
-    except Exception as e:
-        print(f"   ⚠️  Error inserting cities: {e}")
+    print("\n📍 Upserting cities...")
+    bulk_load("cities", ({k: v for k, v in city.items() if k != "id"} for city in CITIES_DATA), batch_size, workers)
     
-    # Insert activities
-    print("\n🎯 Inserting activities...")
-    try:
-        for city in CITIES_DATA:
-            activities = create_activities_for_city(city['id'], city['city_name'])
-            if activities:
-                for activity in activities:
-                    supabase.table("activities").insert(activity).execute()
-                print(f"   ✓ Added {len(activities)} activities for {city['city_name']}")
-    except Exception as e:
-        print(f"   ⚠️  Error inserting activities: {e}")
+    print("\n🎯 Upserting activities...")
+    activities = []
+    for city in CITIES_DATA:
+        city_id = city_ids.get((city["city_name"], city["country"]))
+        if city_id:
+            for activity in create_activities_for_city(city_id, city["city_name"]):
+                activity.pop("id")
+                activities.append(activity)
+    bulk_load("activities", activities, batch_size, workers)
     
     print("\n✅ Database seeding complete!")
     print("\n📊 Summary:")
-    print(f"   • {len(CITIES_DATA)} cities added")
-    print(f"   • Activities added for major cities")
+    print(f"   • {len(CITIES_DATA)} cities upserted")
+    print(f"   • {len(activities)} activities upserted")
     print(f"   • Ready to use the recommendation system!")
 
+def main():
+    parser = argparse.ArgumentParser(description="Seed or bulk-load the GlobeTrotter catalog")
+    parser.add_argument("--cities", help="CSV/JSONL file of cities (city_name, country, ...)")
+    parser.add_argument(
+        "--activities",
+        help="CSV/JSONL file of activities (city_id or city_name+country, act_name, ...)"
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if not args.cities and not args.activities:
+        seed_database(args.batch_size, args.workers)
+        return
+
+    # Cities first, so activities can resolve city_name+country to ids
+    if args.cities:
+        print("📍 Loading cities...")
+        bulk_load("cities", read_rows(args.cities), args.batch_size, args.workers)
+    if args.activities:
+        print("🎯 Loading activities...")
+        bulk_load("activities", read_rows(args.activities), args.batch_size, args.workers)
+
 if __name__ == "__main__":
-    seed_database()
\ No newline at end of file
+    main()
@@ -0,0 +1,430 @@
+"""
+Caches with TTL expiry: an in-process LRU, and shared backends for running
+several workers.
+
+TTLCache is a plain synchronous in-process cache. Lookups that should stay
+consistent across workers use make_cache() instead. It returns an async
+cache whose backend is picked by CACHE_BACKEND:
+
+- memory: a TTLCache per process (the default; fine for one worker)
+- redis: every lookup goes to Redis, so all workers share one copy
+- tiered: a short-lived TTLCache in front of Redis. Deletes and clears are
+  published on a Redis channel, so other workers drop their local copies
+  at once instead of serving them until CACHE_L1_TTL runs out.
+
+make_versions() gives version counters (used to key caches by data version)
+that are shared the same way.
+"""
+
+import asyncio
+import json
+import os
+import pickle
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # only needed for CACHE_BACKEND=redis/tiered
+    aioredis = None
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "globetrotter")
+CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", "5"))
+
+INVALIDATION_CHANNEL = f"{CACHE_KEY_PREFIX}:invalidate"
+
+# Returned by TTLCache.get when a key is absent, so None can be cached
+MISSING = object()
+
+# Every named cache registers itself here so its counters can be reported
+_registry: Dict[str, Any] = {}
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after a time-to-live"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        if name:
+            _registry[name] = self
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": _hit_rate(self.hits, self.misses),
+        }
+
+
+def _hit_rate(hits: int, misses: int) -> float:
+    lookups = hits + misses
+    return round(hits / lookups, 4) if lookups else 0.0
+
+
+# ==================== SHARED BACKENDS ====================
+
+_redis = None
+_listener: Optional[asyncio.Task] = None
+# Lets a worker skip its own invalidation messages
+_instance_id = uuid.uuid4().hex
+
+
+def use_redis_client(client):
+    """Use an existing client (e.g. fakeredis.aioredis.FakeRedis() in tests)"""
+    global _redis
+    _redis = client
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        if aioredis is None:
+            raise RuntimeError(f"CACHE_BACKEND={CACHE_BACKEND} needs the redis package")
+        _redis = aioredis.from_url(REDIS_URL)
+    return _redis
+
+
+def _key_str(key: Hashable) -> str:
+    if isinstance(key, tuple):
+        return ":".join(str(part) for part in key)
+    return str(key)
+
+
+class MemoryBackend:
+    """Async face over a per-process TTLCache"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        _registry[name] = self
+
+    async def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        return self.local.get(key, default)
+
+    async def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        found = {}
+        for key in keys:
+            value = self.local.get(key)
+            if value is not MISSING:
+                found[key] = value
+        return found
+
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+
+    async def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None):
+        for key, value in items.items():
+            self.local.set(key, value, ttl)
+
+    async def delete(self, key: Hashable):
+        self.local.delete(key)
+
+    async def clear(self):
+        self.local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self.local.stats()}
+
+
+class RedisBackend:
+    """Values pickled under CACHE_KEY_PREFIX:name:key, expiring through Redis TTLs"""
+
+    def __init__(self, name: str, ttl: float, register: bool = True):
+        self.name = name
+        self.ttl = ttl
+        self.prefix = f"{CACHE_KEY_PREFIX}:{name}:"
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        if register:
+            _registry[name] = self
+
+    def _error(self, action: str, e: Exception):
+        # A cache outage degrades to misses; it never fails the request
+        self.errors += 1
+        print(f"Error on cache {self.name} {action}: {str(e)}")
+
+    async def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        found = await self.get_many([key])
+        return found.get(key, default)
+
+    async def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            raw = await get_redis().mget([self.prefix + _key_str(key) for key in keys])
+        except Exception as e:
+            self._error("get", e)
+            self.misses += len(keys)
+            return {}
+        found = {key: pickle.loads(value) for key, value in zip(keys, raw) if value is not None}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl_ms = max(1, int((self.ttl if ttl is None else ttl) * 1000))
+        try:
+            await get_redis().set(self.prefix + _key_str(key), pickle.dumps(value), px=ttl_ms)
+        except Exception as e:
+            self._error("set", e)
+
+    async def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None):
+        """Store several values in one round trip"""
+        if not items:
+            return
+        ttl_ms = max(1, int((self.ttl if ttl is None else ttl) * 1000))
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self.prefix + _key_str(key), pickle.dumps(value), px=ttl_ms)
+            await pipe.execute()
+        except Exception as e:
+            self._error("set", e)
+
+    async def delete(self, key: Hashable):
+        try:
+            await get_redis().delete(self.prefix + _key_str(key))
+        except Exception as e:
+            self._error("delete", e)
+
+    async def clear(self):
+        try:
+            client = get_redis()
+            batch = []
+            async for redis_key in client.scan_iter(match=self.prefix + "*", count=500):
+                batch.append(redis_key)
+                if len(batch) >= 500:
+                    await client.delete(*batch)
+                    batch = []
+            if batch:
+                await client.delete(*batch)
+        except Exception as e:
+            self._error("clear", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": _hit_rate(self.hits, self.misses),
+        }
+
+
+class TieredBackend:
+    """Per-process TTLCache (L1) in front of Redis (L2), kept coherent over pub/sub"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.local = TTLCache(maxsize=maxsize, ttl=min(ttl, CACHE_L1_TTL))
+        self.shared = RedisBackend(name, ttl, register=False)
+        _registry[name] = self
+
+    async def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        found = await self.get_many([key])
+        return found.get(key, default)
+
+    async def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        found = {}
+        remote = []
+        for key in keys:
+            value = self.local.get(_key_str(key))
+            if value is MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        if remote:
+            fetched = await self.shared.get_many(remote)
+            for key, value in fetched.items():
+                self.local.set(_key_str(key), value)
+            found.update(fetched)
+        return found
+
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self.local.set(_key_str(key), value, None if ttl is None else min(ttl, self.local.ttl))
+        await self.shared.set(key, value, ttl)
+
+    async def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None):
+        local_ttl = None if ttl is None else min(ttl, self.local.ttl)
+        for key, value in items.items():
+            self.local.set(_key_str(key), value, local_ttl)
+        await self.shared.set_many(items, ttl)
+
+    async def delete(self, key: Hashable):
+        self.local.delete(_key_str(key))
+        await self.shared.delete(key)
+        await _publish({"cache": self.name, "key": _key_str(key)})
+
+    async def clear(self):
+        self.local.clear()
+        await self.shared.clear()
+        await _publish({"cache": self.name, "key": None})
+
+    def drop_local(self, key: Optional[str]):
+        if key is None:
+            self.local.clear()
+        else:
+            self.local.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "tiered",
+            "l1": self.local.stats(),
+            "l2": self.shared.stats(),
+        }
+
+
+def make_cache(name: str, maxsize: int = 1024, ttl: float = 300.0):
+    """A named async cache on the configured CACHE_BACKEND"""
+    if CACHE_BACKEND == "redis":
+        return RedisBackend(name, ttl)
+    if CACHE_BACKEND == "tiered":
+        return TieredBackend(name, maxsize, ttl)
+    if CACHE_BACKEND != "memory":
+        raise RuntimeError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+    return MemoryBackend(name, maxsize, ttl)
+
+
+# ==================== VERSION COUNTERS ====================
+
+class MemoryVersions:
+    def __init__(self, name: str):
+        self.name = name
+        self._versions: Dict[str, int] = {}
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, int]:
+        return {key: self._versions.get(key, 0) for key in keys}
+
+    async def bump(self, key: str) -> int:
+        self._versions[key] = self._versions.get(key, 0) + 1
+        return self._versions[key]
+
+
+class RedisVersions:
+    """Counters in one Redis hash, so every worker agrees on the current version"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.redis_key = f"{CACHE_KEY_PREFIX}:versions:{name}"
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, int]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        raw = await get_redis().hmget(self.redis_key, keys)
+        return {key: int(value) if value is not None else 0 for key, value in zip(keys, raw)}
+
+    async def bump(self, key: str) -> int:
+        return int(await get_redis().hincrby(self.redis_key, key, 1))
+
+
+def make_versions(name: str):
+    """Per-key version counters, shared across workers unless CACHE_BACKEND=memory"""
+    if CACHE_BACKEND in ("redis", "tiered"):
+        return RedisVersions(name)
+    return MemoryVersions(name)
+
+
+# ==================== INVALIDATION MESSAGES ====================
+
+async def _publish(message: Dict[str, Any]):
+    try:
+        await get_redis().publish(INVALIDATION_CHANNEL, json.dumps({**message, "sender": _instance_id}))
+    except Exception as e:
+        print(f"Error publishing cache invalidation: {str(e)}")
+
+
+async def _listen():
+    """Drop local copies that another worker invalidated"""
+    while True:
+        try:
+            pubsub = get_redis().pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything may have changed while we were not subscribed
+            for cache in _registry.values():
+                if isinstance(cache, TieredBackend):
+                    cache.drop_local(None)
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                payload = json.loads(message["data"])
+                cache = _registry.get(payload["cache"])
+                if payload["sender"] != _instance_id and isinstance(cache, TieredBackend):
+                    cache.drop_local(payload["key"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in cache invalidation listener: {str(e)}")
+            await asyncio.sleep(1)
+
+
+async def start_cache():
+    """Start the invalidation listener when local copies need one"""
+    global _listener
+    if CACHE_BACKEND == "tiered" and _listener is None:
+        _listener = asyncio.create_task(_listen())
+
+
+async def close_cache():
+    global _listener, _redis
+    if _listener is not None:
+        _listener.cancel()
+        _listener = None
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
+
+
+def register_stats(name: str, source: Any):
+    """Report source.stats() under name in cache_stats()"""
+    _registry[name] = source
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss counters for every named cache"""
+    return {name: cache.stats() for name, cache in _registry.items()}
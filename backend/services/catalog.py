@@ -0,0 +1,107 @@
+"""
+Cached reads of the city catalog.
+
+Cities rarely change, so rows are cached by id and search results by
+(search, country, limit), on the shared cache backend. Writes to the cities
+table must call invalidate_cities(). A city's activity listings are cached
+under its activities version, so schedule.invalidate_city_templates() also
+expires them.
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional
+
+from services.cache import make_cache, MISSING
+from services.schedule import activities_versions
+from services.singleflight import reads
+
+CITY_CACHE_TTL = float(os.getenv("CITY_CACHE_TTL", "600"))
+CITY_CACHE_SIZE = int(os.getenv("CITY_CACHE_SIZE", "5000"))
+CITY_QUERY_CACHE_SIZE = int(os.getenv("CITY_QUERY_CACHE_SIZE", "1000"))
+CITY_ACTIVITIES_CACHE_SIZE = int(os.getenv("CITY_ACTIVITIES_CACHE_SIZE", "2000"))
+
+city_cache = make_cache("cities", maxsize=CITY_CACHE_SIZE, ttl=CITY_CACHE_TTL)
+city_query_cache = make_cache("city_queries", maxsize=CITY_QUERY_CACHE_SIZE, ttl=CITY_CACHE_TTL)
+city_activities_cache = make_cache("city_activities", maxsize=CITY_ACTIVITIES_CACHE_SIZE, ttl=CITY_CACHE_TTL)
+
+
+async def _remember(cities: Iterable[dict]):
+    await city_cache.set_many({city["id"]: city for city in cities})
+
+
+async def get_city(db, city_id: str) -> Optional[dict]:
+    """Return a city row, or None if it does not exist"""
+    city = await city_cache.get(city_id)
+    if city is not MISSING:
+        return city
+
+    response = await db.table("cities").select("*").eq("id", city_id).limit(1).execute()
+    if not response.data:
+        return None
+    await _remember(response.data)
+    return response.data[0]
+
+
+async def get_cities_by_ids(db, city_ids: Iterable[str]) -> Dict[str, dict]:
+    """Return {id: row} for the given ids, fetching all misses in one query"""
+    city_ids = set(city_ids)
+    found = await city_cache.get_many(city_ids)
+    missing = [city_id for city_id in city_ids if city_id not in found]
+
+    if missing:
+        response = await db.table("cities").select("*").in_("id", missing).execute()
+        rows = response.data or []
+        await _remember(rows)
+        found.update({city["id"]: city for city in rows})
+
+    return found
+
+
+async def search_cities(db, search: Optional[str], country: Optional[str], limit: int) -> List[dict]:
+    """Non-blacklisted cities matching a name fragment and/or country"""
+    key = (search.lower() if search else None, country, limit)
+    cities = await city_query_cache.get(key)
+    if cities is not MISSING:
+        return cities
+
+    query = db.table("cities").select("*").eq("is_blacklisted", False)
+    if search:
+        query = query.ilike("city_name", f"%{search}%")
+    if country:
+        query = query.eq("country", country)
+
+    response = await query.limit(limit).execute()
+    cities = response.data or []
+    await _remember(cities)
+    await city_query_cache.set(key, cities)
+    return cities
+
+
+async def get_city_activities(db, city_id: str, category: Optional[str] = None) -> List[dict]:
+    """A city's activities, optionally of one category"""
+    versions = await activities_versions([city_id])
+    key = (city_id, category, versions[city_id])
+    activities = await city_activities_cache.get(key)
+    if activities is not MISSING:
+        return activities
+
+    async def load():
+        query = db.table("activities").select("*").eq("city_id", city_id)
+        if category:
+            query = query.eq("category", category)
+
+        response = await query.execute()
+        activities = response.data or []
+        await city_activities_cache.set(key, activities)
+        return activities
+
+    # On a miss (e.g. on expiry) concurrent requests share one load. The
+    # version is part of the key, so nobody joins a load older than their write.
+    return await reads.do(("city_activities",) + key, load)
+
+
+async def invalidate_cities(city_id: Optional[str] = None):
+    """Drop cached search results, and the row for city_id if given"""
+    await city_query_cache.clear()
+    if city_id:
+        await city_cache.delete(city_id)
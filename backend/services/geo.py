@@ -0,0 +1,134 @@
+"""
+Spatial index over city coordinates.
+
+Cities are bucketed into a latitude/longitude grid. A radius query only
+visits the cells overlapping the search circle and checks haversine distance
+for the cities in them; k-nearest runs radius queries with a doubling radius
+until at least k cities fall inside, which guarantees the k closest are
+among them.
+"""
+
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+MAX_DISTANCE_KM = EARTH_RADIUS_KM * math.pi
+
+GEO_CELL_DEGREES = float(os.getenv("GEO_CELL_DEGREES", "1.0"))
+GEO_INDEX_TTL = float(os.getenv("GEO_INDEX_TTL", "600"))
+
+CITY_COLUMNS = "id, city_name, country, latitude, longitude, cost_index, popularity"
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    """Grid index answering radius and k-nearest queries over cities"""
+
+    def __init__(self, cities: List[dict], cell_degrees: float = GEO_CELL_DEGREES):
+        self.cell = cell_degrees
+        self.rows = math.ceil(180 / cell_degrees)
+        self.cols = math.ceil(360 / cell_degrees)
+        self.cells: Dict[Tuple[int, int], List[dict]] = {}
+        self.size = 0
+        for city in cities:
+            if city.get("latitude") is None or city.get("longitude") is None:
+                continue
+            self.cells.setdefault(self._cell_of(city["latitude"], city["longitude"]), []).append(city)
+            self.size += 1
+        self.built_at = time.monotonic()
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        row = min(int((lat + 90) / self.cell), self.rows - 1)
+        col = int(((lon + 180) % 360) / self.cell) % self.cols
+        return row, col
+
+    def _candidate_cells(self, lat: float, lon: float, radius_km: float):
+        dlat = radius_km / KM_PER_DEGREE
+        row_min, _ = self._cell_of(max(lat - dlat, -90.0), lon)
+        row_max, _ = self._cell_of(min(lat + dlat, 90.0), lon)
+
+        # Longitude half-width of the circle; the whole band near the poles
+        angular = radius_km / EARTH_RADIUS_KM
+        if abs(lat) + dlat >= 90 or math.sin(angular) >= math.cos(math.radians(lat)):
+            col_span = self.cols
+        else:
+            dlon = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(lat))))
+            col_span = min(self.cols, 2 * (math.ceil(dlon / self.cell) + 1) + 1)
+
+        _, center_col = self._cell_of(lat, lon)
+        if col_span >= self.cols:
+            cols = range(self.cols)
+        else:
+            half = col_span // 2
+            cols = [(center_col + offset) % self.cols for offset in range(-half, half + 1)]
+
+        for row in range(row_min, row_max + 1):
+            for col in cols:
+                bucket = self.cells.get((row, col))
+                if bucket:
+                    yield bucket
+
+    def within(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        exclude_id: Optional[str] = None
+    ) -> List[Tuple[float, dict]]:
+        """(distance_km, city) for every city within radius_km, nearest first"""
+        found = []
+        for bucket in self._candidate_cells(lat, lon, radius_km):
+            for city in bucket:
+                if city["id"] == exclude_id:
+                    continue
+                distance = haversine_km(lat, lon, city["latitude"], city["longitude"])
+                if distance <= radius_km:
+                    found.append((distance, city))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int,
+        max_radius_km: float = MAX_DISTANCE_KM,
+        exclude_id: Optional[str] = None
+    ) -> List[Tuple[float, dict]]:
+        """The k closest cities (optionally capped at max_radius_km), nearest first"""
+        radius = min(max(self.cell * KM_PER_DEGREE, 50.0), max_radius_km)
+        while True:
+            found = self.within(lat, lon, radius, exclude_id)
+            if len(found) >= k or radius >= max_radius_km:
+                return found[:k]
+            radius = min(radius * 2, max_radius_km)
+
+
+_index: Optional[GeoIndex] = None
+
+
+def invalidate_geo_index():
+    global _index
+    _index = None
+
+
+async def get_geo_index(db) -> GeoIndex:
+    """The process-wide index, rebuilt from the cities table when missing or expired"""
+    global _index
+    if _index is None or time.monotonic() - _index.built_at >= GEO_INDEX_TTL:
+        cities = await db.fetch_all(
+            lambda: db.table("cities").select(CITY_COLUMNS).eq("is_blacklisted", False).order("id")
+        )
+        _index = GeoIndex(cities)
+    return _index
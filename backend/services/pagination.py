@@ -0,0 +1,80 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor is the sort-key values of the last row of a page, JSON-encoded and
+base64url'd. Clients pass it back unchanged to get the next page. Cursors are
+client-supplied, so every value is checked against its column's type and
+re-serialized before it goes anywhere near a filter.
+"""
+
+import base64
+import json
+import uuid
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("not a number")
+    return float(value)
+
+
+def _string(parse: Callable[[str], Any]) -> Callable[[Any], str]:
+    def check(value: Any) -> str:
+        if not isinstance(value, str):
+            raise ValueError("not a string")
+        parsed = parse(value)
+        return str(parsed) if isinstance(parsed, uuid.UUID) else parsed.isoformat()
+    return check
+
+
+# Cursor value kinds: each returns the canonical value or raises ValueError
+CURSOR_KINDS: Dict[str, Callable[[Any], Any]] = {
+    "uuid": _string(uuid.UUID),
+    "date": _string(date.fromisoformat),
+    "datetime": _string(datetime.fromisoformat),
+    "number": _number,
+}
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], *kinds: str) -> Optional[List[Any]]:
+    """Return the cursor's values, checked against kinds (keys of CURSOR_KINDS);
+    None for no cursor, ValueError if malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(kinds):
+        raise ValueError("Invalid cursor")
+    try:
+        return [CURSOR_KINDS[kind](value) for kind, value in zip(kinds, values)]
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def split_page(rows: List[dict], limit: int, *sort_columns: str):
+    """Trim a limit+1 fetch to one page; returns (rows, next_cursor or None)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(*(last[column] for column in sort_columns))
+
+
+def keyset_filter(column: str, value: Any, after_id: str, descending: bool = True) -> str:
+    """PostgREST or=(...) filter selecting rows after (value, id) in the sort order.
+
+    Values must come from decode_cursor, which guarantees they contain no
+    characters that could break out of the quotes.
+    """
+    op = "lt" if descending else "gt"
+    return f'{column}.{op}."{value}",and({column}.eq."{value}",id.{op}."{after_id}")'
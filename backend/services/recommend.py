@@ -1,21 +1,174 @@
-def recommend_activities(user_id: str, db, limit: int = 10):
-    query = """
-        SELECT
-            a.id,
-            a.act_name,
-            a.category,
-            a.description,
-            COUNT(ui.interest) AS match_score
-        FROM activities a
-        JOIN user_interests ui
-          ON (
-               LOWER(a.category) LIKE '%' || LOWER(ui.interest) || '%'
-               OR LOWER(a.description) LIKE '%' || LOWER(ui.interest) || '%'
-             )
-        WHERE ui.user_id = %s
-        GROUP BY a.id
-        ORDER BY match_score DESC
-        LIMIT %s;
-    """
-
-    return db.fetch_all(query, (user_id, limit))
+"""
+Interest-based activity recommendations.
+
+Activities are indexed once as a sparse TF-IDF matrix over the words of their
+category and description (rows L2-normalised). A user's interests become a
+query vector in the same space, so scoring every activity is one sparse
+matrix-vector product and the top k come from an argpartition.
+
+Only the first build makes a request wait. Later rebuilds (after activity
+writes, or every RECOMMENDER_REFRESH_SECONDS) run in the background while the
+current model keeps serving, and start at most once per
+RECOMMENDER_MIN_REBUILD_SECONDS however many writes arrive.
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+RECOMMENDER_REFRESH_SECONDS = float(os.getenv("RECOMMENDER_REFRESH_SECONDS", "600"))
+RECOMMENDER_MIN_REBUILD_SECONDS = float(os.getenv("RECOMMENDER_MIN_REBUILD_SECONDS", "60"))
+
+ACTIVITY_COLUMNS = "id, act_name, category, description"
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercased words with a light plural strip ("museums" -> "museum")"""
+    if not text:
+        return []
+    return [
+        word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+        for word in _WORD.findall(text.lower())
+    ]
+
+
+class ActivityRecommender:
+    """TF-IDF matrix over a snapshot of the activities table"""
+
+    def __init__(self, activities: List[dict]):
+        self.activities = activities
+        self.vocabulary: Dict[str, int] = {}
+
+        rows, cols, counts = [], [], []
+        for row, activity in enumerate(activities):
+            terms: Dict[int, int] = {}
+            for word in tokenize(activity.get("category")) + tokenize(activity.get("description")):
+                col = self.vocabulary.setdefault(word, len(self.vocabulary))
+                terms[col] = terms.get(col, 0) + 1
+            rows.extend([row] * len(terms))
+            cols.extend(terms.keys())
+            counts.extend(terms.values())
+
+        shape = (len(activities), len(self.vocabulary))
+        tf = sparse.csr_matrix(
+            (np.asarray(counts, dtype=np.float32), (np.asarray(rows), np.asarray(cols))),
+            shape=shape,
+        )
+        tf.data = 1.0 + np.log(tf.data)
+
+        # Smoothed idf, as in scikit-learn
+        document_frequency = np.bincount(tf.indices, minlength=shape[1])
+        self.idf = (np.log((1 + shape[0]) / (1 + document_frequency)) + 1.0).astype(np.float32)
+
+        matrix = tf @ sparse.diags(self.idf)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        self.matrix = sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix, dtype=np.float32)
+        self.built_at = time.monotonic()
+
+    def interest_vector(self, interests: List[str]) -> Optional[np.ndarray]:
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for interest in interests:
+            for word in tokenize(interest):
+                col = self.vocabulary.get(word)
+                if col is not None:
+                    vector[col] += self.idf[col]
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def recommend(self, interests: List[str], limit: int = 10) -> List[dict]:
+        vector = self.interest_vector(interests)
+        if vector is None or not self.activities:
+            return []
+
+        scores = self.matrix @ vector
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        return [
+            {
+                "id": self.activities[i]["id"],
+                "act_name": self.activities[i].get("act_name"),
+                "category": self.activities[i].get("category"),
+                "description": self.activities[i].get("description"),
+                "match_score": round(float(scores[i]), 4),
+            }
+            for i in candidates
+        ]
+
+
+_recommender: Optional[ActivityRecommender] = None
+_stale = False
+_build_lock = asyncio.Lock()
+_rebuild_task: Optional[asyncio.Task] = None
+_last_build_started = float("-inf")
+
+
+def invalidate_recommender():
+    """Rebuild the matrix soon (call after activities change)"""
+    global _stale
+    _stale = True
+
+
+async def _load_activities(db) -> List[dict]:
+    return await db.fetch_all(lambda: db.table("activities").select(ACTIVITY_COLUMNS).order("id"))
+
+
+async def _build(db):
+    global _recommender, _stale, _last_build_started
+    # Writes that land while loading mark it stale again for the next rebuild
+    _stale = False
+    _last_build_started = time.monotonic()
+    activities = await _load_activities(db)
+    # Matrix construction is CPU-bound; keep it off the event loop
+    _recommender = await asyncio.to_thread(ActivityRecommender, activities)
+
+
+async def _rebuild_in_background(db):
+    global _stale
+    try:
+        await _build(db)
+    except Exception as e:
+        # Keep serving the old model; retry after the minimum interval
+        _stale = True
+        print(f"Error rebuilding recommender: {str(e)}")
+
+
+def _rebuild_due() -> bool:
+    now = time.monotonic()
+    if now - _last_build_started < RECOMMENDER_MIN_REBUILD_SECONDS:
+        return False
+    return _stale or now - _recommender.built_at >= RECOMMENDER_REFRESH_SECONDS
+
+
+async def get_recommender(db) -> ActivityRecommender:
+    global _rebuild_task
+    if _recommender is None:
+        async with _build_lock:
+            # Another request may have built it while we waited
+            if _recommender is None:
+                await _build(db)
+        return _recommender
+
+    if _rebuild_due() and (_rebuild_task is None or _rebuild_task.done()):
+        _rebuild_task = asyncio.create_task(_rebuild_in_background(db))
+    return _recommender
+
+
+async def recommend_activities(user_id: str, db, limit: int = 10):
+    response = await db.table("user_interests").select("interest").eq("user_id", user_id).execute()
+    interests = [row["interest"] for row in response.data or [] if row.get("interest")]
+    if not interests:
+        return []
+
+    recommender = await get_recommender(db)
+    return recommender.recommend(interests, limit)
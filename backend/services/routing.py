@@ -0,0 +1,179 @@
+"""
+Visiting-order optimisation for trip stops (an open-path TSP).
+
+Small trips are solved exactly with Held-Karp dynamic programming,
+vectorised over predecessors with NumPy. Larger trips start from a
+nearest-neighbour tour and are improved with 2-opt and or-opt moves until no
+move helps or the time budget runs out.
+"""
+
+import os
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.geo import EARTH_RADIUS_KM
+
+EXACT_MAX_STOPS = int(os.getenv("ROUTE_EXACT_MAX_STOPS", "12"))
+ROUTE_TIME_BUDGET_MS = float(os.getenv("ROUTE_TIME_BUDGET_MS", "200"))
+
+
+def distance_matrix(coords: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """Pairwise haversine distances (km) between (lat, lon) points"""
+    points = np.radians(np.asarray(coords, dtype=np.float64))
+    lat = points[:, 0][:, None]
+    lon = points[:, 1][:, None]
+    a = (
+        np.sin((lat - lat.T) / 2) ** 2
+        + np.cos(lat) * np.cos(lat.T) * np.sin((lon - lon.T) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def path_length(order: Sequence[int], dist) -> float:
+    return float(sum(dist[order[i]][order[i + 1]] for i in range(len(order) - 1)))
+
+
+def held_karp(dist: np.ndarray, start: Optional[int] = 0) -> List[int]:
+    """Exact shortest open path visiting every node (starting at `start` if given)"""
+    n = len(dist)
+    if n <= 2:
+        return list(range(n))
+
+    full = 1 << n
+    dp = np.full((full, n), np.inf)
+    parent = np.full((full, n), -1, dtype=np.int64)
+    starts = [start] if start is not None else range(n)
+    for node in starts:
+        dp[1 << node, node] = 0.0
+
+    for mask in range(1, full):
+        row = dp[mask]
+        if not np.isfinite(row).any():
+            continue
+        # Extend every path ending in `mask` by one unvisited node
+        for nxt in range(n):
+            if mask & (1 << nxt):
+                continue
+            candidates = row + dist[:, nxt]
+            best = int(np.argmin(candidates))
+            new_mask = mask | (1 << nxt)
+            if candidates[best] < dp[new_mask, nxt]:
+                dp[new_mask, nxt] = candidates[best]
+                parent[new_mask, nxt] = best
+
+    mask = full - 1
+    last = int(np.argmin(dp[mask]))
+    order = []
+    while last != -1:
+        order.append(last)
+        prev = int(parent[mask, last])
+        mask ^= 1 << last
+        last = prev
+    return order[::-1]
+
+
+def nearest_neighbour(dist: List[List[float]], start: int = 0) -> List[int]:
+    n = len(dist)
+    order = [start]
+    remaining = set(range(n)) - {start}
+    while remaining:
+        here = dist[order[-1]]
+        nxt = min(remaining, key=here.__getitem__)
+        order.append(nxt)
+        remaining.remove(nxt)
+    return order
+
+
+def _edge(dist, order, i) -> float:
+    """Length of the edge leaving position i (0 past the end of the open path)"""
+    return dist[order[i]][order[i + 1]] if i + 1 < len(order) else 0.0
+
+
+def two_opt_pass(order: List[int], dist, first: int, deadline: float) -> bool:
+    """Apply improving segment reversals; True if anything changed"""
+    n = len(order)
+    improved = False
+    for i in range(first, n - 1):
+        if time.perf_counter() > deadline:
+            break
+        for j in range(i + 1, n):
+            before = dist[order[i - 1]][order[i]] if i > 0 else 0.0
+            after = _edge(dist, order, j)
+            new_before = dist[order[i - 1]][order[j]] if i > 0 else 0.0
+            new_after = dist[order[i]][order[j + 1]] if j + 1 < n else 0.0
+            if new_before + new_after < before + after - 1e-9:
+                order[i:j + 1] = reversed(order[i:j + 1])
+                improved = True
+    return improved
+
+
+def or_opt_pass(order: List[int], dist, first: int, deadline: float) -> bool:
+    """Move segments of 1-3 stops to a better position; True if anything changed"""
+    improved = False
+    for length in (1, 2, 3):
+        i = first
+        while i + length <= len(order):
+            if time.perf_counter() > deadline:
+                return improved
+            segment = order[i:i + length]
+            rest = order[:i] + order[i + length:]
+            removed_gain = (
+                (dist[order[i - 1]][segment[0]] if i > 0 else 0.0)
+                + (dist[segment[-1]][order[i + length]] if i + length < len(order) else 0.0)
+                - (dist[order[i - 1]][order[i + length]] if i > 0 and i + length < len(order) else 0.0)
+            )
+            best_cost, best_pos, best_segment = removed_gain - 1e-9, None, None
+            for pos in range(first, len(rest) + 1):
+                prev = rest[pos - 1] if pos > 0 else None
+                nxt = rest[pos] if pos < len(rest) else None
+                link = dist[prev][nxt] if prev is not None and nxt is not None else 0.0
+                for candidate in (segment, segment[::-1]):
+                    cost = (
+                        (dist[prev][candidate[0]] if prev is not None else 0.0)
+                        + (dist[candidate[-1]][nxt] if nxt is not None else 0.0)
+                        - link
+                    )
+                    if cost < best_cost:
+                        best_cost, best_pos, best_segment = cost, pos, candidate
+            if best_pos is not None:
+                order[:] = rest[:best_pos] + best_segment + rest[best_pos:]
+                improved = True
+            else:
+                i += 1
+    return improved
+
+
+def local_search(dist: List[List[float]], start: Optional[int] = 0, budget_ms: float = ROUTE_TIME_BUDGET_MS) -> List[int]:
+    deadline = time.perf_counter() + budget_ms / 1000
+    order = nearest_neighbour(dist, start if start is not None else 0)
+    first = 1 if start is not None else 0
+    while time.perf_counter() < deadline:
+        changed = two_opt_pass(order, dist, first, deadline)
+        changed = or_opt_pass(order, dist, first, deadline) or changed
+        if not changed:
+            break
+    return order
+
+
+def optimize_order(
+    coords: Sequence[Tuple[float, float]],
+    fix_start: bool = True,
+    budget_ms: float = ROUTE_TIME_BUDGET_MS
+) -> Tuple[List[int], str]:
+    """Best visiting order of the points (indexes into coords) and the method used"""
+    n = len(coords)
+    if n <= 2:
+        return list(range(n)), "exact"
+
+    dist = distance_matrix(coords)
+    start = 0 if fix_start else None
+    if n <= EXACT_MAX_STOPS:
+        return held_karp(dist, start), "exact"
+
+    order = local_search(dist.tolist(), start, budget_ms)
+    # Never return something worse than the input order
+    if path_length(order, dist) > path_length(range(n), dist):
+        order = list(range(n))
+    return order, "heuristic"
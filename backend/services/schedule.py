@@ -0,0 +1,544 @@
+"""
+Daily schedule generation for trip stops.
+
+Meal and hotel blocks depend only on (city_id, cost_index), and the pool of
+suggestion candidates only on the city's activities, so both are cached per
+city as a "template". Any write to a city's activities must call
+invalidate_city_templates().
+
+Selected activities are packed by duration into each day's free windows (the
+gaps between meals and hotel check-in/out), spilling to other days when a day
+is full. Activities that fit nowhere are reported rather than dropped.
+
+Suggestions are sampled with a seed derived from (trip, stop, catalog
+version), so the same trip renders the same schedule until its activities or
+the city's catalog change.
+"""
+
+import hashlib
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.cache import make_cache, make_versions
+
+SCHEDULE_TEMPLATE_TTL = float(os.getenv("SCHEDULE_TEMPLATE_TTL", "600"))
+SCHEDULE_TEMPLATE_CACHE_SIZE = int(os.getenv("SCHEDULE_TEMPLATE_CACHE_SIZE", "2000"))
+SUGGESTION_POOL_SIZE = 20
+
+template_cache = make_cache("schedule_templates", maxsize=SCHEDULE_TEMPLATE_CACHE_SIZE, ttl=SCHEDULE_TEMPLATE_TTL)
+
+# Bumped whenever a city's activities change; part of the template cache key
+activity_versions = make_versions("city_activities")
+
+
+async def activities_versions(city_ids: Iterable[str]) -> Dict[str, int]:
+    """Current activities version per city"""
+    try:
+        return await activity_versions.get_many(city_ids)
+    except Exception as e:
+        # -1 matches nothing cached, so an outage only costs cache hits
+        print(f"Error reading activity versions: {str(e)}")
+        return {city_id: -1 for city_id in city_ids}
+
+
+async def invalidate_city_templates(city_id: str):
+    """Mark every cached template for this city as stale"""
+    try:
+        await activity_versions.bump(city_id)
+    except Exception as e:
+        # The write itself succeeded; stale templates expire with their TTL
+        print(f"Error invalidating schedule templates for city {city_id}: {str(e)}")
+
+
+def suggestion_seed(trip_id: str, stop_id: str, version: int, reshuffle: Optional[int] = None) -> int:
+    """Stable sampling seed for a stop's suggestions, given its city's activities version;
+    pass reshuffle to pick another stable draw"""
+    key = f"{trip_id}:{stop_id}:{version}:{reshuffle or 0}"
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+
+
+def get_meal_recommendations(city_id: str, cost_index: int) -> Dict[str, Any]:
+    """Get meal recommendations based on city"""
+    multiplier = cost_index / 50.0
+    
+    meals = {
+        "breakfast": {
+            "name": "Local Breakfast Spot",
+            "type": "Breakfast",
+            "cost": round(10 * multiplier, 2),
+            "duration": 1.0,
+            "description": "Start your day with a traditional breakfast"
+        },
+        "lunch": {
+            "name": "Midday Dining",
+            "type": "Lunch",
+            "cost": round(20 * multiplier, 2),
+            "duration": 1.5,
+            "description": "Refuel with local cuisine"
+        },
+        "dinner": {
+            "name": "Evening Restaurant",
+            "type": "Dinner",
+            "cost": round(35 * multiplier, 2),
+            "duration": 2.0,
+            "description": "End your day with a delightful meal"
+        }
+    }
+    return meals
+
+
+def get_hotel_recommendation(city_id: str, cost_index: int) -> Dict[str, Any]:
+    """Get hotel recommendation based on city"""
+    multiplier = cost_index / 50.0
+    base_cost = 80 * multiplier
+    
+    return {
+        "name": "Recommended Hotel",
+        "type": "Accommodation",
+        "cost_per_night": round(base_cost, 2),
+        "check_in": "15:00",
+        "check_out": "11:00",
+        "description": "Comfortable stay in the heart of the city"
+    }
+
+
+def build_schedule_template(city_id: str, cost_index: int, candidates: list) -> Dict[str, Any]:
+    return {
+        "meals": get_meal_recommendations(city_id, cost_index),
+        "hotel": get_hotel_recommendation(city_id, cost_index),
+        "candidates": candidates,
+        "fixed_items": None,
+    }
+
+
+async def get_schedule_templates(db, cost_indexes: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+    """Templates for several cities ({city_id: cost_index}), loading all misses in one query"""
+    # Versions are read before the activities, so a concurrent invalidation isn't overwritten
+    versions = await activities_versions(list(cost_indexes))
+    keys = {city_id: (city_id, cost_index, versions[city_id]) for city_id, cost_index in cost_indexes.items()}
+    cached = await template_cache.get_many(keys.values())
+
+    templates = {}
+    missing = {}
+    for city_id, cost_index in cost_indexes.items():
+        template = cached.get(keys[city_id])
+        if template is None:
+            missing[city_id] = cost_index
+        else:
+            templates[city_id] = template
+
+    if not missing:
+        return templates
+
+    # One query for every missing city. The pool is capped per city on the
+    # embedded resource, so PostgREST's max-rows (which counts city rows here)
+    # can't truncate one city's pool to feed another's
+    try:
+        response = await db.table("cities").select("id, activities(*)").in_(
+            "id", list(missing)
+        ).order("id", foreign_table="activities").limit(
+            SUGGESTION_POOL_SIZE, foreign_table="activities"
+        ).execute()
+    except Exception as e:
+        # Schedules still render without suggestions; don't cache the failure
+        print(f"Error loading activity suggestions: {str(e)}")
+        for city_id, cost_index in missing.items():
+            templates[city_id] = build_schedule_template(city_id, cost_index, [])
+        return templates
+
+    candidates_by_city = {city_id: [] for city_id in missing}
+    for city in response.data or []:
+        if city["id"] in candidates_by_city:
+            candidates_by_city[city["id"]] = city.get("activities") or []
+
+    loaded = {}
+    for city_id, cost_index in missing.items():
+        templates[city_id] = build_schedule_template(city_id, cost_index, candidates_by_city[city_id])
+        loaded[keys[city_id]] = templates[city_id]
+    await template_cache.set_many(loaded)
+
+    return templates
+
+
+# ==================== DAY LAYOUT ====================
+# Times are minutes after midnight
+
+BREAKFAST_AT = 8 * 60
+LUNCH_AT = 13 * 60
+DINNER_AT = 19 * 60
+CHECK_OUT_AT = 11 * 60
+CHECK_IN_AT = 15 * 60
+HOTEL_BLOCK_MINUTES = 30
+
+MORNING = (9 * 60, 13 * 60)
+AFTERNOON = (14 * 60 + 30, 19 * 60)
+EVENING = (21 * 60, 23 * 60)
+FULL_DAY_MINUTES = AFTERNOON[1] - MORNING[0]
+
+FREE_TIME_MINUTES = 90
+FREE_TIME_LATEST_START = 18 * 60
+
+DEFAULT_ACTIVITY_HOURS = 2.0
+DEFAULT_SUGGESTION_HOURS = 1.5
+
+
+def _clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+# ==================== SCHEDULE ITEMS ====================
+# Immutable slotted records, serialized natively by orjson. Meal, hotel and
+# leisure items are identical every day, so one instance per template is
+# shared by every day (and every trip) that uses it.
+
+@dataclass(frozen=True, slots=True)
+class ScheduleItem:
+    time: str
+    type: str
+    title: str
+    description: str
+    duration: float
+    cost: float
+    is_selected: bool
+    is_meal: bool
+    is_hotel: bool
+    icon: str
+
+
+@dataclass(frozen=True, slots=True)
+class ActivityItem(ScheduleItem):
+    category: str
+
+
+@dataclass(frozen=True, slots=True)
+class SuggestedItem(ActivityItem):
+    is_suggested: bool = True
+
+
+EVENING_LEISURE = ScheduleItem(
+    time=_clock(EVENING[0]), type="free_time", title="Evening Leisure",
+    description="Unwind and prepare for tomorrow", duration=1.0, cost=0,
+    is_selected=False, is_meal=False, is_hotel=False, icon="🌙"
+)
+
+
+def _meal_item(at: int, meal: Dict[str, Any], icon: str) -> ScheduleItem:
+    return ScheduleItem(
+        time=_clock(at), type="meal", title=meal["name"], description=meal["description"],
+        duration=meal["duration"], cost=meal["cost"],
+        is_selected=False, is_meal=True, is_hotel=False, icon=icon
+    )
+
+
+def _fixed_items(template: Dict[str, Any]) -> Dict[str, ScheduleItem]:
+    """Meal and hotel items for a template, built once and then shared"""
+    items = template.get("fixed_items")
+    if items is None:
+        meals = template["meals"]
+        hotel = template["hotel"]
+        items = {
+            "breakfast": _meal_item(BREAKFAST_AT, meals["breakfast"], "🍳"),
+            "lunch": _meal_item(LUNCH_AT, meals["lunch"], "🍽️"),
+            "dinner": _meal_item(DINNER_AT, meals["dinner"], "🍷"),
+            "check_in": ScheduleItem(
+                time=_clock(CHECK_IN_AT), type="accommodation", title=hotel["name"],
+                description=f"Check-in • {hotel['description']}", duration=0.5, cost=hotel["cost_per_night"],
+                is_selected=False, is_meal=False, is_hotel=True, icon="🏨"
+            ),
+            "check_out": ScheduleItem(
+                time=_clock(CHECK_OUT_AT), type="accommodation", title=hotel["name"],
+                description="Check-out", duration=0.5, cost=0,
+                is_selected=False, is_meal=False, is_hotel=True, icon="🏨"
+            ),
+        }
+        template["fixed_items"] = items
+    return items
+
+
+def _duration_minutes(hours: Optional[float], default: float) -> int:
+    return max(1, int(round(float(hours or default) * 60)))
+
+
+def _split(span: Tuple[int, int], block_start: int, block_minutes: int) -> List[Tuple[int, int]]:
+    """The parts of span not covered by a fixed block"""
+    start, end = span
+    parts = [(start, min(end, block_start)), (max(start, block_start + block_minutes), end)]
+    return [(a, b) for a, b in parts if b > a]
+
+
+class _Window:
+    """A free interval of one day, filled from its start"""
+
+    __slots__ = ("day", "part", "start", "end", "cursor")
+
+    def __init__(self, day: int, part: str, start: int, end: int):
+        self.day = day
+        self.part = part
+        self.start = start
+        self.end = end
+        self.cursor = start
+
+    @property
+    def capacity(self) -> int:
+        return self.end - self.cursor
+
+
+def _day_windows(day: int, is_first: bool, is_last: bool) -> List[_Window]:
+    morning = _split(MORNING, CHECK_OUT_AT, HOTEL_BLOCK_MINUTES) if is_last else [MORNING]
+    afternoon = _split(AFTERNOON, CHECK_IN_AT, HOTEL_BLOCK_MINUTES) if is_first else [AFTERNOON]
+    return (
+        [_Window(day, "morning", *span) for span in morning]
+        + [_Window(day, "afternoon", *span) for span in afternoon]
+        + [_Window(day, "evening", *EVENING)]
+    )
+
+
+class _CapacityTree:
+    """Max segment tree over window capacities: finds the first window at or
+    after a position that can still fit a duration in O(log n)"""
+
+    def __init__(self, capacities: List[int]):
+        self.size = 1
+        while self.size < len(capacities):
+            self.size *= 2
+        self.tree = [0] * (2 * self.size)
+        self.tree[self.size:self.size + len(capacities)] = capacities
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def update(self, index: int, capacity: int):
+        node = index + self.size
+        self.tree[node] = capacity
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def first_fit(self, start: int, need: int) -> Optional[int]:
+        return self._first_fit(1, 0, self.size, start, need)
+
+    def _first_fit(self, node: int, lo: int, hi: int, start: int, need: int) -> Optional[int]:
+        if hi <= start or self.tree[node] < need:
+            return None
+        if hi - lo == 1:
+            return lo
+        mid = (lo + hi) // 2
+        found = self._first_fit(2 * node, lo, mid, start, need)
+        if found is None:
+            found = self._first_fit(2 * node + 1, mid, hi, start, need)
+        return found
+
+
+def _find_full_day(windows: List[_Window], first_window: List[int], target: int, need: int) -> Optional[int]:
+    """First untouched plain day (from target on, then earlier) for a 09:00-19:00 activity"""
+    if need > FULL_DAY_MINUTES:
+        return None
+    total_days = len(first_window)
+    for offset in range(total_days):
+        day = (target + offset) % total_days
+        morning, afternoon = windows[first_window[day]], windows[first_window[day] + 1]
+        # Check-in/out days have their daytime windows split, so never qualify
+        if (morning.start, morning.end, afternoon.start, afternoon.end) != (*MORNING, *AFTERNOON):
+            continue
+        if morning.cursor == morning.start and afternoon.cursor == afternoon.start:
+            return day
+    return None
+
+
+def pack_activities(activities: List[Dict[str, Any]], total_days: int):
+    """
+    Place activities into the free windows of a stop.
+
+    Each activity targets a day round-robin (the old even spread) and takes
+    the first window from that day on with room for it, wrapping round to
+    earlier days when needed. Longest activities go first, and the segment
+    tree keeps each placement O(log n). An activity that fits no window may
+    take over a whole untouched day, replacing lunch.
+
+    Returns (placements, windows, unscheduled, full_days) where placements
+    holds (start_minute, part, activity) tuples per day.
+    """
+    windows: List[_Window] = []
+    first_window: List[int] = []
+    for day in range(total_days):
+        first_window.append(len(windows))
+        windows.extend(_day_windows(day, day == 0, day == total_days - 1))
+
+    tree = _CapacityTree([window.capacity for window in windows])
+    placements: List[List[Tuple[int, str, Dict[str, Any]]]] = [[] for _ in range(total_days)]
+    full_days = [False] * total_days
+    unscheduled = []
+
+    durations = [_duration_minutes(act.get("duration_hours"), DEFAULT_ACTIVITY_HOURS) for act in activities]
+    for idx in sorted(range(len(activities)), key=lambda i: -durations[i]):
+        activity = activities[idx]
+        need = durations[idx]
+        target = idx % total_days
+
+        slot = tree.first_fit(first_window[target], need)
+        if slot is None:
+            slot = tree.first_fit(0, need)
+        if slot is not None:
+            window = windows[slot]
+            placements[window.day].append((window.cursor, window.part, activity))
+            window.cursor += need
+            tree.update(slot, window.capacity)
+            continue
+
+        day = _find_full_day(windows, first_window, target, need)
+        if day is not None:
+            placements[day].append((MORNING[0], "full_day", activity))
+            full_days[day] = True
+            for slot in (first_window[day], first_window[day] + 1):
+                windows[slot].cursor = windows[slot].end
+                tree.update(slot, 0)
+            continue
+
+        unscheduled.append({
+            "activity_id": activity.get("id"),
+            "title": activity.get("act_name", "Activity"),
+            "duration": activity.get("duration_hours") or DEFAULT_ACTIVITY_HOURS,
+            "reason": "Longer than a full day" if need > FULL_DAY_MINUTES else "No free window long enough at this stop"
+        })
+
+    return placements, windows, unscheduled, full_days
+
+
+def _take_suggestion(suggestions: List[Dict[str, Any]], capacity: int) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Pop the first suggestion that fits in capacity minutes"""
+    for i, suggestion in enumerate(suggestions):
+        need = _duration_minutes(suggestion.get("duration_hours"), DEFAULT_SUGGESTION_HOURS)
+        if need <= capacity:
+            return suggestions.pop(i), need
+    return None
+
+
+def generate_smart_schedule(
+    stop_data: Dict[str, Any],
+    selected_activities: List[Dict[str, Any]],
+    city_id: str,
+    cost_index: int,
+    template: Dict[str, Any],
+    seed: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Generate a smart daily schedule including:
+    - Selected activities, packed around meals by duration
+    - Suggested additional activities
+    - Meals (breakfast, lunch, dinner)
+    - Hotel check-in/check-out
+    - Free time
+
+    Suggestions are drawn with random.Random(seed); see suggestion_seed().
+    Returns (daily_schedules, unscheduled_activities).
+    """
+    start_date = datetime.strptime(stop_data['start_date'], '%Y-%m-%d').date()
+    end_date = datetime.strptime(stop_data['end_date'], '%Y-%m-%d').date()
+    total_days = (end_date - start_date).days + 1
+    if total_days < 1:
+        return [], []
+
+    # Meal/hotel items and the suggestion pool come from the city's schedule template
+    fixed = _fixed_items(template)
+
+    # Filter out already selected activities
+    selected_ids = {act['id'] for act in selected_activities}
+    suggested_activities = [act for act in template["candidates"] if act['id'] not in selected_ids]
+    random.Random(seed).shuffle(suggested_activities)
+
+    placements, windows, unscheduled, full_days = pack_activities(selected_activities, total_days)
+    windows_by_day: List[List[_Window]] = [[] for _ in range(total_days)]
+    for window in windows:
+        windows_by_day[window.day].append(window)
+
+    daily_schedules = []
+    for day in range(total_days):
+        current_date = start_date + timedelta(days=day)
+        schedule_items = [fixed["breakfast"], fixed["dinner"]]
+        if not full_days[day]:
+            schedule_items.append(fixed["lunch"])
+
+        # Hotel check-in on day 1, check-out on the last day
+        if day == 0:
+            schedule_items.append(fixed["check_in"])
+        if day == total_days - 1:
+            schedule_items.append(fixed["check_out"])
+
+        # Selected activities, at their packed start times
+        evening_booked = False
+        for start, part, activity in placements[day]:
+            evening_booked = evening_booked or part == "evening"
+            schedule_items.append(ActivityItem(
+                time=_clock(start),
+                type="activity",
+                title=activity.get("act_name", "Activity"),
+                description=activity.get("description", "Explore this attraction"),
+                duration=activity.get("duration_hours") or DEFAULT_ACTIVITY_HOURS,
+                cost=activity.get("avg_cost") or 0,
+                category=activity.get("category", "General"),
+                is_selected=True,
+                is_meal=False,
+                is_hotel=False,
+                icon="🌙" if part == "evening" else "🎯"
+            ))
+
+        # One suggested activity in the first morning gap it fits
+        for window in windows_by_day[day]:
+            if window.part != "morning" or not suggested_activities:
+                continue
+            taken = _take_suggestion(suggested_activities, window.capacity)
+            if taken is None:
+                continue
+            suggested, need = taken
+            schedule_items.append(SuggestedItem(
+                time=_clock(window.cursor),
+                type="activity",
+                title=f"💡 {suggested.get('act_name', 'Suggested Activity')}",
+                description=f"Recommended: {suggested.get('description', 'Explore this attraction')}",
+                duration=suggested.get("duration_hours") or DEFAULT_SUGGESTION_HOURS,
+                cost=suggested.get("avg_cost") or 0,
+                category=suggested.get("category", "Suggested"),
+                is_selected=False,
+                is_meal=False,
+                is_hotel=False,
+                icon="💡"
+            ))
+            window.cursor += need
+            break
+
+        # Free Time / Rest in what is left of the afternoon
+        afternoon = [window for window in windows_by_day[day] if window.part == "afternoon"][-1]
+        if afternoon.cursor <= FREE_TIME_LATEST_START and afternoon.capacity >= FREE_TIME_MINUTES:
+            schedule_items.append(ScheduleItem(
+                time=_clock(afternoon.cursor),
+                type="free_time",
+                title="Free Time",
+                description="Relax or explore at your own pace",
+                duration=FREE_TIME_MINUTES / 60,
+                cost=0,
+                is_selected=False,
+                is_meal=False,
+                is_hotel=False,
+                icon="⏰"
+            ))
+
+        # Evening leisure when nothing is booked after dinner
+        if not evening_booked:
+            schedule_items.append(EVENING_LEISURE)
+
+        # Sort schedule by time
+        schedule_items.sort(key=lambda item: item.time)
+
+        daily_schedules.append({
+            "date": current_date.isoformat(),
+            "day_number": day + 1,
+            "day_name": current_date.strftime("%A"),
+            "schedule": schedule_items,
+            "daily_cost": round(sum(item.cost for item in schedule_items), 2),
+            "total_activities": sum(1 for item in schedule_items if item.type == "activity")
+        })
+
+    return daily_schedules, unscheduled
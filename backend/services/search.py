@@ -0,0 +1,65 @@
+"""
+Indexed catalog search backed by the Postgres functions in
+db/migrations/003_search_indexes.sql.
+
+Results are ranked (full-text prefix match + trigram similarity, so typos
+still match) and paged with a (rank, id) keyset cursor, so a deep page costs
+the same as the first one.
+"""
+
+from typing import List, Optional, Tuple
+
+from services.pagination import encode_cursor, decode_cursor
+
+
+async def _ranked_search(db, function: str, row_key: str, params: dict, limit: int, cursor: Optional[str]):
+    after = decode_cursor(cursor, "number", "uuid")
+    response = await db.rpc(function, {
+        **params,
+        "p_after_rank": after[0] if after else None,
+        "p_after_id": after[1] if after else None,
+        # One extra row tells us whether there is a next page
+        "p_limit": limit + 1,
+    }).execute()
+
+    results = response.data or []
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = encode_cursor(last["rank"], last[row_key]["id"])
+
+    rows = []
+    for result in results:
+        row = result[row_key]
+        row["search_rank"] = result["rank"]
+        rows.append(row)
+    return rows, next_cursor
+
+
+async def search_activities_indexed(
+    db,
+    search: str,
+    category: Optional[str],
+    city_id: Optional[str],
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    return await _ranked_search(db, "search_activities_ranked", "activity", {
+        "p_query": search,
+        "p_category": category,
+        "p_city_id": city_id,
+    }, limit, cursor)
+
+
+async def search_cities_indexed(
+    db,
+    search: str,
+    country: Optional[str],
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    return await _ranked_search(db, "search_cities_ranked", "city", {
+        "p_query": search,
+        "p_country": country,
+    }, limit, cursor)
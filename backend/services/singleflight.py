@@ -0,0 +1,72 @@
+"""
+Request coalescing for hot reads.
+
+Concurrent identical reads share one upstream request: the first caller
+starts it, later callers with the same key await the same task. The task is
+not tied to any one caller, so a client disconnecting doesn't fail everyone
+else waiting on it. Results are shared, so callers must not mutate them.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from services.cache import register_stats
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        register_stats(name, self)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark a failure as retrieved even if every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_requests": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
+
+
+reads = SingleFlight("singleflight_reads")
+
+
+def query_key(query) -> tuple:
+    """Identity of a PostgREST request: method, table path, filters/projection and
+    the headers that change the response shape (e.g. .single())"""
+    headers = query.headers
+    return (
+        query.http_method,
+        str(query.path),
+        str(query.params),
+        headers.get("Accept"),
+        headers.get("Prefer"),
+    )
+
+
+async def execute(query):
+    """``await query.execute()``, shared with identical queries already in flight"""
+    return await reads.do(query_key(query), query.execute)
@@ -0,0 +1,131 @@
+"""
+Materialized trip schedules.
+
+A trip's schedule is stored as a header (title and ordered stop ids) plus one
+snapshot per stop, so a warm read is a handful of cache lookups. Writes drop
+only what they touch: activity changes drop their stop's snapshot, new stops
+and trip edits drop the header, and unchanged stops are reused on rebuild.
+Stop snapshots also record the city's activities version they were built
+from, so catalog edits expire them without any bookkeeping here. Both caches
+live on the shared cache backend, so every worker sees the same snapshots.
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+
+from services.cache import make_cache, make_versions, MISSING
+from services.schedule import activities_versions
+
+SCHEDULE_SNAPSHOT_TTL = float(os.getenv("SCHEDULE_SNAPSHOT_TTL", "600"))
+SCHEDULE_SNAPSHOT_CACHE_SIZE = int(os.getenv("SCHEDULE_SNAPSHOT_CACHE_SIZE", "20000"))
+# Reshuffled variants kept per stop; the default draw is variant 0
+MAX_VARIANTS_PER_STOP = 4
+
+trip_header_cache = make_cache("schedule_trip_headers", maxsize=SCHEDULE_SNAPSHOT_CACHE_SIZE, ttl=SCHEDULE_SNAPSHOT_TTL)
+stop_snapshot_cache = make_cache("schedule_stop_snapshots", maxsize=SCHEDULE_SNAPSHOT_CACHE_SIZE, ttl=SCHEDULE_SNAPSHOT_TTL)
+
+# Write counters, one per trip header and one per stop, bumped by every
+# invalidation in any worker. A rebuilt header or stop whose counter moved
+# while it was being built may hold stale rows, so it is served but not stored.
+_write_counter = make_versions("schedule_snapshots")
+
+
+def _trip_key(trip_id: str) -> str:
+    return f"trip:{trip_id}"
+
+
+async def write_versions(trip_id: str, stop_ids: List[str] = ()) -> Optional[Dict[str, int]]:
+    """Current counters for the trip header and the given stops, or None if unavailable"""
+    try:
+        return await _write_counter.get_many([_trip_key(trip_id), *stop_ids])
+    except Exception as e:
+        print(f"Error reading schedule snapshot writes: {str(e)}")
+        return None
+
+
+async def _bump_writes(key: str):
+    try:
+        await _write_counter.bump(key)
+    except Exception as e:
+        print(f"Error recording schedule snapshot write: {str(e)}")
+
+
+async def get_header(trip_id: str) -> Optional[Dict[str, Any]]:
+    """{"title", "stop_ids"} for the trip, or None when it must be reloaded"""
+    header = await trip_header_cache.get(trip_id)
+    return None if header is MISSING else header
+
+
+async def get_stops(stop_ids: List[str], reshuffle: int) -> Dict[str, Dict[str, Any]]:
+    """Valid snapshots for the given stops ({stop_id: stop_schedule})"""
+    cached = await stop_snapshot_cache.get_many(stop_ids)
+    entries = {
+        stop_id: variants[reshuffle]
+        for stop_id, variants in cached.items()
+        if reshuffle in variants
+    }
+    versions = await activities_versions({entry["city_id"] for entry in entries.values()})
+    return {
+        stop_id: entry["schedule"]
+        for stop_id, entry in entries.items()
+        if entry["version"] == versions[entry["city_id"]]
+    }
+
+
+async def store(
+    trip_id: str,
+    title: str,
+    stop_ids: List[str],
+    built: List[tuple],
+    reshuffle: int,
+    seen_writes: Optional[Dict[str, int]]
+):
+    """
+    Save a rebuilt header and the stops built for it.
+
+    built holds (stop_id, city_id, city_version, stop_schedule) tuples, where
+    city_version was read before the stop's rows were loaded. seen_writes holds
+    the write_versions() read before the header and those stops were loaded;
+    only the ones no write has touched since are stored.
+    """
+    if seen_writes is None:
+        return
+    built_ids = [stop_id for stop_id, *_ in built]
+    current = await write_versions(trip_id, built_ids)
+    if current is None:
+        return
+    unchanged = {key for key, version in current.items() if seen_writes.get(key) == version}
+
+    if _trip_key(trip_id) in unchanged:
+        await trip_header_cache.set(trip_id, {"title": title, "stop_ids": list(stop_ids)})
+    built = [entry for entry in built if entry[0] in unchanged]
+    cached = await stop_snapshot_cache.get_many([stop_id for stop_id, *_ in built])
+    updated = {}
+    for stop_id, city_id, city_version, stop_schedule in built:
+        variants = dict(cached.get(stop_id) or {})
+        variants.pop(reshuffle, None)
+        if len(variants) >= MAX_VARIANTS_PER_STOP:
+            variants.pop(next(iter(variants)))
+        variants[reshuffle] = {"city_id": city_id, "version": city_version, "schedule": stop_schedule}
+        updated[stop_id] = variants
+    await stop_snapshot_cache.set_many(updated)
+
+
+async def invalidate_stop(stop_id: str):
+    """A stop's activities changed"""
+    await _bump_writes(stop_id)
+    await stop_snapshot_cache.delete(stop_id)
+
+
+async def invalidate_trip(trip_id: str):
+    """The trip's title or list of stops changed; stop snapshots stay valid"""
+    await _bump_writes(_trip_key(trip_id))
+    await trip_header_cache.delete(trip_id)
+
+
+async def drop_trip(trip_id: str):
+    """Forget a deleted trip, including the stops its header knows about"""
+    header = await get_header(trip_id)
+    await invalidate_trip(trip_id)
+    for stop_id in header["stop_ids"] if header else []:
+        await stop_snapshot_cache.delete(stop_id)
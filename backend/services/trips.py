@@ -0,0 +1,48 @@
+"""
+Trip ownership checks backed by a per-user owned-trip-id cache.
+
+A warm cache answers "does this user own this trip?" without a query, so
+trip-scoped endpoints only pay for their real request. On a miss the user's
+full set of trip ids is loaded in one query and cached.
+"""
+
+import os
+from typing import Iterable, Set
+
+from services.cache import TTLCache, MISSING
+
+OWNED_TRIPS_CACHE_TTL = float(os.getenv("OWNED_TRIPS_CACHE_TTL", "120"))
+OWNED_TRIPS_CACHE_SIZE = int(os.getenv("OWNED_TRIPS_CACHE_SIZE", "10000"))
+
+owned_trips_cache = TTLCache(maxsize=OWNED_TRIPS_CACHE_SIZE, ttl=OWNED_TRIPS_CACHE_TTL, name="owned_trips")
+
+
+async def load_owned_trip_ids(db, user_id: str) -> Set[str]:
+    response = await db.table("trips").select("id").eq("user_id", user_id).execute()
+    trip_ids = {trip["id"] for trip in response.data or []}
+    owned_trips_cache.set(user_id, trip_ids)
+    return trip_ids
+
+
+async def user_owns_trip(db, user_id: str, trip_id: str) -> bool:
+    trip_ids = owned_trips_cache.get(user_id)
+    if trip_ids is not MISSING and trip_id in trip_ids:
+        return True
+    # Not cached, or possibly created since the cache was filled
+    return trip_id in await load_owned_trip_ids(db, user_id)
+
+
+def set_owned_trips(user_id: str, trip_ids: Iterable[str]):
+    owned_trips_cache.set(user_id, set(trip_ids))
+
+
+def remember_trip(user_id: str, trip_id: str):
+    trip_ids = owned_trips_cache.get(user_id)
+    if trip_ids is not MISSING:
+        trip_ids.add(trip_id)
+
+
+def forget_trip(user_id: str, trip_id: str):
+    trip_ids = owned_trips_cache.get(user_id)
+    if trip_ids is not MISSING:
+        trip_ids.discard(trip_id)
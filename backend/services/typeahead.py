@@ -0,0 +1,234 @@
+"""
+In-process typeahead over city and activity names.
+
+Every word of city_name/country and act_name/category is indexed in a sorted
+term list with postings kept in rank order, so a lookup merges the postings of
+the terms under the query's longest word and stops after `limit` documents
+that match the other words - no database round trip, and no sort of every
+match. Queries must have a word of at least TYPEAHEAD_MIN_PREFIX characters,
+since a one-letter prefix matches most of the catalog. The index is built at
+startup and kept fresh by a periodic delta refresh (rows whose
+TYPEAHEAD_DELTA_COLUMN is newer than the last refresh), with an occasional
+full rebuild to pick up edits and deletions.
+"""
+
+import asyncio
+import heapq
+import os
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+TYPEAHEAD_ENABLED = os.getenv("TYPEAHEAD_ENABLED", "0") == "1"
+TYPEAHEAD_REFRESH_SECONDS = float(os.getenv("TYPEAHEAD_REFRESH_SECONDS", "60"))
+TYPEAHEAD_REBUILD_SECONDS = float(os.getenv("TYPEAHEAD_REBUILD_SECONDS", "3600"))
+TYPEAHEAD_DELTA_COLUMN = os.getenv("TYPEAHEAD_DELTA_COLUMN", "created_at")
+TYPEAHEAD_MIN_PREFIX = int(os.getenv("TYPEAHEAD_MIN_PREFIX", "2"))
+
+CITY_COLUMNS = "id, city_name, country, popularity, is_blacklisted"
+ACTIVITY_COLUMNS = "id, act_name, category, city_id"
+
+DocKey = Tuple[str, str]  # (kind, id)
+Rank = Tuple[bool, int, int, DocKey]  # cities first, then popularity, then shorter names
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return _WORD.findall(folded.lower())
+
+
+class TypeaheadIndex:
+    """Prefix index over catalog documents"""
+
+    def __init__(self):
+        self._docs: Dict[DocKey, dict] = {}
+        self._doc_terms: Dict[DocKey, Set[str]] = {}
+        self._ranks: Dict[DocKey, Rank] = {}
+        self._postings: Dict[str, Set[DocKey]] = {}
+        # Postings sorted by rank, built on first use and dropped when the term changes
+        self._ranked: Dict[str, List[Rank]] = {}
+        self._terms: List[str] = []
+        self._terms_dirty = False
+        self.built_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def clear(self):
+        self._docs.clear()
+        self._doc_terms.clear()
+        self._ranks.clear()
+        self._postings.clear()
+        self._ranked.clear()
+        self._terms = []
+        self._terms_dirty = False
+
+    def _add(self, key: DocKey, doc: dict, text: Iterable[Optional[str]]):
+        self._remove(key)
+        terms = {token for value in text for token in tokenize(value)}
+        self._docs[key] = doc
+        self._doc_terms[key] = terms
+        self._ranks[key] = (
+            doc["kind"] != "city",
+            -doc.get("popularity", 0),
+            len(doc.get("city_name") or doc.get("act_name") or ""),
+            key,
+        )
+        for term in terms:
+            self._ranked.pop(term, None)
+            postings = self._postings.get(term)
+            if postings is None:
+                self._postings[term] = {key}
+                self._terms_dirty = True
+            else:
+                postings.add(key)
+
+    def _remove(self, key: DocKey):
+        for term in self._doc_terms.pop(key, ()):
+            self._ranked.pop(term, None)
+            postings = self._postings[term]
+            postings.discard(key)
+            if not postings:
+                del self._postings[term]
+                self._terms_dirty = True
+        self._docs.pop(key, None)
+        self._ranks.pop(key, None)
+
+    def add_city(self, city: dict):
+        if city.get("is_blacklisted"):
+            self._remove(("city", city["id"]))
+            return
+        self._add(("city", city["id"]), {
+            "kind": "city",
+            "id": city["id"],
+            "city_name": city.get("city_name"),
+            "country": city.get("country"),
+            "popularity": city.get("popularity") or 0,
+        }, (city.get("city_name"), city.get("country")))
+
+    def add_activity(self, activity: dict):
+        self._add(("activity", activity["id"]), {
+            "kind": "activity",
+            "id": activity["id"],
+            "act_name": activity.get("act_name"),
+            "category": activity.get("category"),
+            "city_id": activity.get("city_id"),
+        }, (activity.get("act_name"), activity.get("category")))
+
+    def _ranked_postings(self, term: str) -> List[Rank]:
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            ranked = self._ranked[term] = sorted(self._ranks[key] for key in self._postings[term])
+        return ranked
+
+    def _prefix_matches(self, prefix: str) -> Iterator[DocKey]:
+        """Documents with a word starting with prefix, best ranked first"""
+        if self._terms_dirty:
+            self._terms = sorted(self._postings)
+            self._terms_dirty = False
+        start = bisect_left(self._terms, prefix)
+        end = bisect_left(self._terms, prefix + "\x7f")
+        merged = heapq.merge(*(self._ranked_postings(term) for term in self._terms[start:end]))
+        previous = None
+        for rank in merged:
+            # A document with several matching words appears once per word
+            if rank != previous:
+                previous = rank
+                yield rank[-1]
+
+    def _has_prefixes(self, key: DocKey, words: List[str]) -> bool:
+        terms = self._doc_terms[key]
+        return all(any(term.startswith(word) for term in terms) for word in words)
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 10) -> List[dict]:
+        """Documents having a word starting with every word of the query"""
+        words = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not words or len(words[0]) < TYPEAHEAD_MIN_PREFIX:
+            return []
+
+        # The longest word has the fewest matching terms; it drives the merge
+        # and the other words are checked per document
+        matches = (
+            key for key in self._prefix_matches(words[0])
+            if (kind is None or key[0] == kind) and self._has_prefixes(key, words[1:])
+        )
+        return [self._docs[key] for key in islice(matches, limit)]
+
+index = TypeaheadIndex()
+_last_refresh: Optional[str] = None
+_last_rebuild = 0.0
+
+
+async def _fetch_all(db, table: str, columns: str, since: Optional[str] = None) -> List[dict]:
+    def build_query():
+        query = db.table(table).select(columns)
+        if table == "cities":
+            query = query.eq("is_blacklisted", False)
+        if since:
+            query = query.gt(TYPEAHEAD_DELTA_COLUMN, since)
+        return query.order("id")
+
+    return await db.fetch_all(build_query)
+
+
+def _build_index(cities: List[dict], activities: List[dict]) -> TypeaheadIndex:
+    fresh = TypeaheadIndex()
+    for city in cities:
+        fresh.add_city(city)
+    for activity in activities:
+        fresh.add_activity(activity)
+    fresh.built_at = time.time()
+    return fresh
+
+
+async def rebuild(db):
+    """Full rebuild from the catalog tables"""
+    global index, _last_refresh, _last_rebuild
+    refresh_started = datetime.now(timezone.utc).isoformat()
+    cities = await _fetch_all(db, "cities", CITY_COLUMNS)
+    activities = await _fetch_all(db, "activities", ACTIVITY_COLUMNS)
+
+    # Indexing is CPU-bound; keep it off the event loop
+    fresh = await asyncio.to_thread(_build_index, cities, activities)
+
+    # Readers always see either the old or the new index, never a partial one
+    index = fresh
+    _last_refresh = refresh_started
+    _last_rebuild = time.monotonic()
+
+
+async def refresh(db):
+    """Add rows created since the last refresh, or rebuild when due"""
+    global _last_refresh
+    if _last_refresh is None or time.monotonic() - _last_rebuild >= TYPEAHEAD_REBUILD_SECONDS:
+        await rebuild(db)
+        return
+
+    refresh_started = datetime.now(timezone.utc).isoformat()
+    cities = await _fetch_all(db, "cities", CITY_COLUMNS + f", {TYPEAHEAD_DELTA_COLUMN}", since=_last_refresh)
+    activities = await _fetch_all(db, "activities", ACTIVITY_COLUMNS + f", {TYPEAHEAD_DELTA_COLUMN}", since=_last_refresh)
+    for city in cities:
+        index.add_city(city)
+    for activity in activities:
+        index.add_activity(activity)
+    _last_refresh = refresh_started
+
+
+async def run_refresher(db):
+    """Background task: build the index, then refresh it periodically"""
+    while True:
+        try:
+            await refresh(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error refreshing typeahead index: {str(e)}")
+        await asyncio.sleep(TYPEAHEAD_REFRESH_SECONDS)
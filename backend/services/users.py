@@ -0,0 +1,39 @@
+"""
+Cached user identity lookups for X-User-Id authorization checks.
+
+Only a narrow column projection is fetched (never password_hash). Unknown ids
+are cached too, for a shorter time, so repeated bad ids don't hit the database.
+"""
+
+import os
+from typing import Optional
+
+from services.cache import make_cache, MISSING
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_NEGATIVE_CACHE_TTL = float(os.getenv("USER_NEGATIVE_CACHE_TTL", "10"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+IDENTITY_COLUMNS = "id, email, first_name, last_name"
+
+user_cache = make_cache("users", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+async def get_user_identity(db, user_id: str) -> Optional[dict]:
+    """Return {id, email, first_name, last_name} for a user, or None if unknown"""
+    identity = await user_cache.get(user_id)
+    if identity is not MISSING:
+        return identity
+
+    response = await db.table("users").select(IDENTITY_COLUMNS).eq("id", user_id).limit(1).execute()
+    if not response.data:
+        await user_cache.set(user_id, None, ttl=USER_NEGATIVE_CACHE_TTL)
+        return None
+
+    identity = response.data[0]
+    await user_cache.set(user_id, identity)
+    return identity
+
+
+async def invalidate_user(user_id: str):
+    await user_cache.delete(user_id)
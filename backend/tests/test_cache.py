@@ -0,0 +1,247 @@
+"""
+Cache backends against fakeredis: memory, redis and tiered caches, version
+counters, and pub/sub invalidation between workers.
+"""
+
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+from services import cache
+from services.cache import (
+    MISSING,
+    MemoryBackend,
+    MemoryVersions,
+    RedisBackend,
+    RedisVersions,
+    TieredBackend,
+)
+
+
+@pytest.fixture
+def redis_client():
+    client = fakeredis.FakeAsyncRedis()
+    cache.use_redis_client(client)
+    yield client
+    cache.use_redis_client(None)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_memory_backend_roundtrip():
+    async def scenario():
+        backend = MemoryBackend("test_memory", maxsize=10, ttl=60)
+        assert await backend.get("a") is MISSING
+        await backend.set("a", {"x": 1})
+        await backend.set(("city", 3), None)
+        assert await backend.get("a") == {"x": 1}
+        assert await backend.get_many(["a", ("city", 3), "b"]) == {"a": {"x": 1}, ("city", 3): None}
+        await backend.delete("a")
+        assert await backend.get("a") is MISSING
+        await backend.clear()
+        assert await backend.get_many([("city", 3)]) == {}
+
+    run(scenario())
+
+
+def test_redis_backend_roundtrip(redis_client):
+    async def scenario():
+        backend = RedisBackend("test_redis", ttl=60)
+        await backend.set(("c1", 50, 0), {"candidates": [1, 2]})
+        await backend.set("none", None)
+        assert await backend.get(("c1", 50, 0)) == {"candidates": [1, 2]}
+        # None is a cached value, not a miss
+        assert await backend.get("none") is None
+        assert await backend.get("absent") is MISSING
+        assert backend.stats()["hits"] == 2
+        assert backend.stats()["misses"] == 1
+
+        await backend.delete("none")
+        assert await backend.get("none") is MISSING
+
+        await backend.set("other", 1)
+        await backend.clear()
+        assert await backend.get_many([("c1", 50, 0), "other"]) == {}
+
+    run(scenario())
+
+
+def test_set_many_on_every_backend(redis_client):
+    async def scenario():
+        for backend in (
+            MemoryBackend("test_set_many_memory", maxsize=10, ttl=60),
+            RedisBackend("test_set_many_redis", ttl=60),
+            TieredBackend("test_set_many_tiered", maxsize=10, ttl=60),
+        ):
+            await backend.set_many({"a": 1, ("c", 2): None})
+            await backend.set_many({})
+            assert await backend.get_many(["a", ("c", 2), "b"]) == {"a": 1, ("c", 2): None}
+
+    run(scenario())
+
+
+def test_redis_set_many_is_one_round_trip(redis_client):
+    calls = []
+    real_pipeline = redis_client.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        pipe = real_pipeline(*args, **kwargs)
+        real_execute = pipe.execute
+
+        async def execute(*a, **kw):
+            calls.append(len(pipe.command_stack))
+            return await real_execute(*a, **kw)
+
+        pipe.execute = execute
+        return pipe
+
+    redis_client.pipeline = counting_pipeline
+
+    async def scenario():
+        backend = RedisBackend("test_set_many_pipeline", ttl=0.05)
+        await backend.set_many({f"k{i}": i for i in range(50)})
+        assert calls == [50]
+        assert len(await backend.get_many([f"k{i}" for i in range(50)])) == 50
+        await asyncio.sleep(0.1)
+        assert await backend.get_many(["k0"]) == {}
+
+    run(scenario())
+
+
+def test_redis_backend_respects_ttl(redis_client):
+    async def scenario():
+        backend = RedisBackend("test_redis_ttl", ttl=60)
+        await backend.set("short", 1, ttl=0.05)
+        assert await backend.get("short") == 1
+        await asyncio.sleep(0.1)
+        assert await backend.get("short") is MISSING
+
+    run(scenario())
+
+
+def test_redis_outage_degrades_to_misses():
+    class Broken:
+        def __getattr__(self, name):
+            async def fail(*args, **kwargs):
+                raise ConnectionError("redis down")
+            return fail
+
+    async def scenario():
+        backend = RedisBackend("test_redis_down", ttl=60)
+        await backend.set("a", 1)
+        assert await backend.get("a") is MISSING
+        await backend.delete("a")
+        assert backend.stats()["errors"] == 3
+
+    cache.use_redis_client(Broken())
+    try:
+        run(scenario())
+    finally:
+        cache.use_redis_client(None)
+
+
+def test_tiered_backend_reads_through_and_fills_local(redis_client):
+    async def scenario():
+        worker_a = TieredBackend("test_tiered_fill", maxsize=10, ttl=60)
+        await worker_a.set("k", "v")
+        # A second worker's empty L1 falls through to Redis, then keeps a copy
+        worker_b = TieredBackend("test_tiered_fill_b", maxsize=10, ttl=60)
+        worker_b.shared = worker_a.shared
+        assert await worker_b.get("k") == "v"
+        assert worker_b.local.get("k") == "v"
+
+    run(scenario())
+
+
+def test_tiered_delete_publishes_invalidation(redis_client):
+    async def scenario():
+        backend = TieredBackend("test_tiered_publish", maxsize=10, ttl=60)
+        pubsub = redis_client.pubsub()
+        await pubsub.subscribe(cache.INVALIDATION_CHANNEL)
+        await pubsub.get_message(timeout=1)  # subscribe confirmation
+
+        await backend.set(("c1", 1), "v")
+        await backend.delete(("c1", 1))
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+        payload = json.loads(message["data"])
+        assert payload["cache"] == "test_tiered_publish"
+        assert payload["key"] == "c1:1"
+        assert await backend.get(("c1", 1)) is MISSING
+        await pubsub.aclose()
+
+    run(scenario())
+
+
+def test_listener_drops_local_copies_invalidated_by_other_workers(redis_client):
+    async def scenario():
+        backend = TieredBackend("test_tiered_listen", maxsize=10, ttl=60)
+        await backend.set("k", "v")
+        await backend.set("other", "w")
+
+        listener = asyncio.create_task(cache._listen())
+        await asyncio.sleep(0.05)
+        # Subscribing drops everything local; refill it
+        await backend.get_many(["k", "other"])
+        assert backend.local.get("k") == "v"
+
+        # Another worker deleted "k" (and its Redis copy)
+        await backend.shared.delete("k")
+        await redis_client.publish(
+            cache.INVALIDATION_CHANNEL,
+            json.dumps({"cache": "test_tiered_listen", "key": "k", "sender": "other-worker"}),
+        )
+        await asyncio.sleep(0.05)
+        assert backend.local.get("k") is MISSING
+        assert backend.local.get("other") == "w"
+        assert await backend.get("k") is MISSING
+
+        # A worker's own messages are ignored; it already applied them
+        await redis_client.publish(
+            cache.INVALIDATION_CHANNEL,
+            json.dumps({"cache": "test_tiered_listen", "key": None, "sender": cache._instance_id}),
+        )
+        await asyncio.sleep(0.05)
+        assert backend.local.get("other") == "w"
+
+        listener.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await listener
+
+    run(scenario())
+
+
+@pytest.mark.parametrize("versions_class", [MemoryVersions, RedisVersions])
+def test_version_counters(redis_client, versions_class):
+    async def scenario():
+        versions = versions_class("test_versions")
+        assert await versions.get_many(["c1", "c2"]) == {"c1": 0, "c2": 0}
+        assert await versions.bump("c1") == 1
+        assert await versions.bump("c1") == 2
+        assert await versions.get_many(["c1", "c2"]) == {"c1": 2, "c2": 0}
+
+    run(scenario())
+
+
+def test_redis_versions_are_shared_between_workers(redis_client):
+    async def scenario():
+        worker_a = RedisVersions("test_shared_versions")
+        worker_b = RedisVersions("test_shared_versions")
+        await worker_a.bump("c1")
+        assert await worker_b.get_many(["c1"]) == {"c1": 1}
+
+    run(scenario())
+
+
+def test_template_invalidation_survives_redis_outage(monkeypatch):
+    from services import schedule
+
+    async def fail(city_id):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(schedule.activity_versions, "bump", fail)
+    # The catalog write already committed; a cache outage must not fail it
+    run(schedule.invalidate_city_templates("c1"))
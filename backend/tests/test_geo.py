@@ -0,0 +1,65 @@
+"""
+Grid index queries against a brute-force haversine scan, including points
+near the poles and across the antimeridian.
+"""
+
+import random
+
+import pytest
+
+from services.geo import GeoIndex, haversine_km
+
+
+def random_cities(rng, n):
+    cities = []
+    for i in range(n):
+        lat = rng.choice([rng.uniform(-90, 90), rng.uniform(80, 90), rng.uniform(-90, -80)])
+        lon = rng.choice([rng.uniform(-180, 180), rng.uniform(175, 180), rng.uniform(-180, -175)])
+        cities.append({"id": f"c{i}", "latitude": lat, "longitude": lon})
+    return cities
+
+
+def brute_force(cities, lat, lon, exclude_id=None):
+    return sorted(
+        (haversine_km(lat, lon, city["latitude"], city["longitude"]), city["id"])
+        for city in cities
+        if city["id"] != exclude_id
+    )
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("cell_degrees", [0.5, 1.0, 5.0])
+def test_within_matches_brute_force(seed, cell_degrees):
+    rng = random.Random(seed)
+    cities = random_cities(rng, 400)
+    index = GeoIndex(cities, cell_degrees=cell_degrees)
+
+    for _ in range(25):
+        city = rng.choice(cities)
+        lat = min(90.0, max(-90.0, city["latitude"] + rng.uniform(-2, 2)))
+        lon = city["longitude"] + rng.uniform(-2, 2)
+        radius = rng.choice([10, 100, 500, 2000, 8000])
+
+        found = [(distance, city["id"]) for distance, city in index.within(lat, lon, radius)]
+        expected = [item for item in brute_force(cities, lat, lon) if item[0] <= radius]
+        assert sorted(found) == expected
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_nearest_matches_brute_force(seed):
+    rng = random.Random(seed)
+    cities = random_cities(rng, 300)
+    index = GeoIndex(cities)
+
+    for _ in range(25):
+        origin = rng.choice(cities)
+        k = rng.randint(1, 20)
+        found = index.nearest(origin["latitude"], origin["longitude"], k, exclude_id=origin["id"])
+        expected = brute_force(cities, origin["latitude"], origin["longitude"], exclude_id=origin["id"])[:k]
+        assert [distance for distance, _ in found] == pytest.approx([distance for distance, _ in expected])
+
+
+def test_cities_without_coordinates_are_skipped():
+    index = GeoIndex([{"id": "a", "latitude": None, "longitude": 2.0}, {"id": "b", "latitude": 1.0, "longitude": 2.0}])
+    assert index.size == 1
+    assert [city["id"] for _, city in index.nearest(1.0, 2.0, 5)] == ["b"]
@@ -0,0 +1,74 @@
+"""
+Recommender rebuilds: stale models keep serving while a background rebuild
+runs, and writes trigger at most one rebuild per interval.
+"""
+
+import asyncio
+
+import pytest
+
+from services import recommend
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.activities = [{"id": "a1", "act_name": "Louvre", "category": "Museum", "description": "art museum"}]
+        self.loads = 0
+        self.release = asyncio.Event()
+
+    async def fetch_all(self, build_query):
+        self.loads += 1
+        if self.loads > 1:
+            await self.release.wait()
+        return list(self.activities)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(recommend, "_recommender", None)
+    monkeypatch.setattr(recommend, "_stale", False)
+    monkeypatch.setattr(recommend, "_rebuild_task", None)
+    monkeypatch.setattr(recommend, "_last_build_started", float("-inf"))
+
+
+def test_stale_model_serves_while_rebuilding(monkeypatch):
+    monkeypatch.setattr(recommend, "RECOMMENDER_MIN_REBUILD_SECONDS", 0)
+
+    async def scenario():
+        monkeypatch.setattr(recommend, "_build_lock", asyncio.Lock())
+        db = FakeDatabase()
+        first = await recommend.get_recommender(db)
+        assert [a["id"] for a in first.recommend(["museums"])] == ["a1"]
+
+        db.activities.append({"id": "a2", "act_name": "Orsay", "category": "Museum", "description": "museum"})
+        recommend.invalidate_recommender()
+        # The rebuild is blocked on its load, yet requests get the old model at once
+        assert await recommend.get_recommender(db) is first
+        await asyncio.sleep(0)
+        assert await recommend.get_recommender(db) is first
+        assert db.loads == 2
+
+        db.release.set()
+        await recommend._rebuild_task
+        rebuilt = await recommend.get_recommender(db)
+        assert rebuilt is not first
+        assert {a["id"] for a in rebuilt.recommend(["museum"])} == {"a1", "a2"}
+
+    asyncio.run(scenario())
+
+
+def test_writes_rebuild_at_most_once_per_interval(monkeypatch):
+    monkeypatch.setattr(recommend, "RECOMMENDER_MIN_REBUILD_SECONDS", 3600)
+
+    async def scenario():
+        monkeypatch.setattr(recommend, "_build_lock", asyncio.Lock())
+        db = FakeDatabase()
+        db.release.set()
+        first = await recommend.get_recommender(db)
+        for _ in range(5):
+            recommend.invalidate_recommender()
+            assert await recommend.get_recommender(db) is first
+        assert db.loads == 1
+        assert recommend._rebuild_task is None
+
+    asyncio.run(scenario())
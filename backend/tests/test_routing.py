@@ -0,0 +1,58 @@
+"""
+Stop-order optimisation: Held-Karp against brute force, and the heuristic
+never returning something worse than the input order.
+"""
+
+import itertools
+import random
+
+import pytest
+
+from services.routing import distance_matrix, held_karp, optimize_order, path_length
+
+
+def random_coords(rng, n):
+    return [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(n)]
+
+
+def brute_force(dist, start):
+    n = len(dist)
+    if start is None:
+        orders = itertools.permutations(range(n))
+    else:
+        orders = ((start, *rest) for rest in itertools.permutations([i for i in range(n) if i != start]))
+    return min(path_length(order, dist) for order in orders)
+
+
+@pytest.mark.parametrize("seed", range(15))
+@pytest.mark.parametrize("fixed_start", [True, False])
+def test_held_karp_matches_brute_force(seed, fixed_start):
+    rng = random.Random(seed)
+    dist = distance_matrix(random_coords(rng, rng.randint(3, 7)))
+    start = 0 if fixed_start else None
+
+    order = held_karp(dist, start)
+
+    assert sorted(order) == list(range(len(dist)))
+    if fixed_start:
+        assert order[0] == 0
+    assert path_length(order, dist) == pytest.approx(brute_force(dist, start))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_heuristic_returns_a_permutation_no_worse_than_input(seed):
+    rng = random.Random(seed)
+    coords = random_coords(rng, 25)
+    dist = distance_matrix(coords)
+
+    order, method = optimize_order(coords, fix_start=True, budget_ms=50)
+
+    assert method == "heuristic"
+    assert order[0] == 0
+    assert sorted(order) == list(range(len(coords)))
+    assert path_length(order, dist) <= path_length(range(len(coords)), dist) + 1e-9
+
+
+def test_trivial_trips_keep_their_order():
+    assert optimize_order([]) == ([], "exact")
+    assert optimize_order([(48.85, 2.35), (51.5, -0.12)]) == ([0, 1], "exact")
@@ -0,0 +1,153 @@
+"""
+Day layout: selected activities are packed around meals and hotel blocks,
+spill to other days when a day is full, and are reported when they fit nowhere.
+"""
+
+import random
+
+import pytest
+
+from services.schedule import (
+    _CapacityTree,
+    build_schedule_template,
+    generate_smart_schedule,
+)
+
+
+def stop(start_date, end_date):
+    return {"start_date": start_date, "end_date": end_date}
+
+
+def activity(idx, hours):
+    return {"id": f"act-{idx}", "act_name": f"Activity {idx}", "duration_hours": hours, "avg_cost": 10}
+
+
+def template(candidates=()):
+    return build_schedule_template("city-1", 50, list(candidates))
+
+
+def minutes(clock):
+    hours, mins = clock.split(":")
+    return int(hours) * 60 + int(mins)
+
+
+def intervals(day):
+    return sorted(
+        (minutes(item.time), minutes(item.time) + round(item.duration * 60), item.title)
+        for item in day["schedule"]
+    )
+
+
+def assert_no_overlap(days):
+    for day in days:
+        spans = intervals(day)
+        for (_, end, title), (start, _, next_title) in zip(spans, spans[1:]):
+            assert end <= start, f"{title} overlaps {next_title} on day {day['day_number']}"
+
+
+def selected_titles(day):
+    return [item.title for item in day["schedule"] if item.type == "activity" and item.is_selected]
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_random_stops_never_overlap_and_account_for_every_activity(seed):
+    rng = random.Random(seed)
+    days = rng.randint(1, 5)
+    selected = [activity(i, rng.choice([0.5, 1, 1.5, 2, 3, 4, 6, 8, 10, 12, None])) for i in range(rng.randint(0, 14))]
+    candidates = [activity(100 + i, rng.choice([1, 1.5, 2])) for i in range(6)]
+
+    schedules, unscheduled = generate_smart_schedule(
+        stop("2026-05-01", f"2026-05-{days:02d}"), selected, "city-1", 50, template(candidates), seed=seed
+    )
+
+    assert len(schedules) == days
+    assert_no_overlap(schedules)
+    placed = [title for day in schedules for title in selected_titles(day)]
+    assert sorted(placed + [entry["title"] for entry in unscheduled]) == sorted(a["act_name"] for a in selected)
+
+
+def test_meals_and_hotel_blocks_are_kept():
+    schedules, _ = generate_smart_schedule(
+        stop("2026-05-01", "2026-05-03"), [activity(i, 3) for i in range(6)], "city-1", 50, template()
+    )
+    first, middle, last = (set(item.title for item in day["schedule"]) for day in schedules)
+    for titles in (first, middle, last):
+        assert {"Local Breakfast Spot", "Midday Dining", "Evening Restaurant"} <= titles
+    hotel_times = [[item.time for item in day["schedule"] if item.is_hotel] for day in schedules]
+    assert hotel_times == [["15:00"], [], ["11:00"]]
+    assert_no_overlap(schedules)
+
+
+def test_overflow_spills_to_other_days_then_to_unscheduled():
+    # Each 4h activity needs a whole morning (09:00-13:00) or afternoon. A
+    # three-day stop has four such windows: day 1 loses its afternoon to
+    # check-in and day 3 its morning to check-out.
+    selected = [activity(i, 4) for i in range(5)]
+    schedules, unscheduled = generate_smart_schedule(
+        stop("2026-05-01", "2026-05-03"), selected, "city-1", 50, template()
+    )
+
+    assert [len(selected_titles(day)) for day in schedules] == [1, 2, 1]
+    assert len(unscheduled) == 1
+    assert unscheduled[0]["reason"] == "No free window long enough at this stop"
+    assert_no_overlap(schedules)
+
+
+def test_long_activity_takes_over_an_untouched_day():
+    schedules, unscheduled = generate_smart_schedule(
+        stop("2026-05-01", "2026-05-03"), [activity(0, 8), activity(1, 11)], "city-1", 50, template()
+    )
+
+    middle = schedules[1]["schedule"]
+    full_day = [item for item in middle if item.title == "Activity 0"]
+    assert [item.time for item in full_day] == ["09:00"]
+    assert "Midday Dining" not in {item.title for item in middle}
+    assert [(entry["activity_id"], entry["reason"]) for entry in unscheduled] == [("act-1", "Longer than a full day")]
+    assert_no_overlap(schedules)
+
+
+def test_single_day_stop_has_check_in_and_check_out():
+    schedules, unscheduled = generate_smart_schedule(
+        stop("2026-05-01", "2026-05-01"), [activity(0, 3), activity(1, 4)], "city-1", 50, template()
+    )
+
+    assert len(schedules) == 1
+    day = schedules[0]["schedule"]
+    assert sorted(item.time for item in day if item.is_hotel) == ["11:00", "15:00"]
+    # Check-in/out split the day, so the longest free window is 15:30-19:00
+    assert [(item.title, item.time) for item in day if item.is_selected] == [("Activity 0", "15:30")]
+    assert [entry["activity_id"] for entry in unscheduled] == ["act-1"]
+    assert_no_overlap(schedules)
+
+
+def test_stop_ending_before_it_starts_is_empty():
+    assert generate_smart_schedule(stop("2026-05-03", "2026-05-01"), [activity(0, 1)], "city-1", 50, template()) == ([], [])
+
+
+def test_suggestions_are_stable_for_a_seed():
+    candidates = [activity(100 + i, 1) for i in range(10)]
+
+    def suggested(seed):
+        schedules, _ = generate_smart_schedule(
+            stop("2026-05-01", "2026-05-04"), [], "city-1", 50, template(candidates), seed=seed
+        )
+        return [item.title for day in schedules for item in day["schedule"] if getattr(item, "is_suggested", False)]
+
+    assert suggested(7) == suggested(7)
+    assert len(suggested(7)) == 4
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_capacity_tree_matches_linear_first_fit(seed):
+    rng = random.Random(seed)
+    capacities = [rng.randint(0, 300) for _ in range(rng.randint(1, 40))]
+    tree = _CapacityTree(capacities)
+    for _ in range(200):
+        if rng.random() < 0.3:
+            index = rng.randrange(len(capacities))
+            capacities[index] = rng.randint(0, 300)
+            tree.update(index, capacities[index])
+            continue
+        start, need = rng.randrange(len(capacities)), rng.randint(1, 300)
+        expected = next((i for i in range(start, len(capacities)) if capacities[i] >= need), None)
+        assert tree.first_fit(start, need) == expected
@@ -0,0 +1,51 @@
+"""
+Snapshot storage only skips the header or stops that were written to while
+they were being rebuilt.
+"""
+
+import asyncio
+
+from services import snapshots
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def built_stop(stop_id):
+    return (stop_id, "city-1", 0, {"stop_id": stop_id})
+
+
+def test_store_keeps_rebuilds_untouched_by_writes():
+    async def scenario():
+        seen = await snapshots.write_versions("trip-a", ["s1", "s2"])
+        # Writes to another trip, and to one of this trip's stops, during the rebuild
+        await snapshots.invalidate_trip("trip-b")
+        await snapshots.invalidate_stop("s2")
+        await snapshots.store("trip-a", "Trip A", ["s1", "s2"], [built_stop("s1"), built_stop("s2")], 0, seen)
+
+        assert await snapshots.get_header("trip-a") == {"title": "Trip A", "stop_ids": ["s1", "s2"]}
+        assert await snapshots.get_stops(["s1", "s2"], 0) == {"s1": {"stop_id": "s1"}}
+
+    run(scenario())
+
+
+def test_store_skips_header_written_during_rebuild():
+    async def scenario():
+        seen = await snapshots.write_versions("trip-c", ["s3"])
+        await snapshots.invalidate_trip("trip-c")
+        await snapshots.store("trip-c", "Trip C", ["s3"], [built_stop("s3")], 0, seen)
+
+        assert await snapshots.get_header("trip-c") is None
+        assert await snapshots.get_stops(["s3"], 0) == {"s3": {"stop_id": "s3"}}
+
+    run(scenario())
+
+
+def test_store_without_versions_stores_nothing():
+    async def scenario():
+        await snapshots.store("trip-d", "Trip D", ["s4"], [built_stop("s4")], 0, None)
+        assert await snapshots.get_header("trip-d") is None
+        assert await snapshots.get_stops(["s4"], 0) == {}
+
+    run(scenario())
@@ -119,9 +119,19 @@ export const activitiesAPI = {
 
 // ==================== TRIPS APIs ====================
 export const tripsAPI = {
-    getAll: (status = null) => {
-        const query = status ? `?status=${status}` : '';
-        return fetchWithAuth(`/api/trips${query}`);
+    // The API returns one page at a time; follow next_cursor until every trip is loaded
+    getAll: async (status = null) => {
+        const trips = [];
+        let cursor = null;
+        do {
+            const params = new URLSearchParams({ limit: '100' });
+            if (status) params.set('status', status);
+            if (cursor) params.set('cursor', cursor);
+            const page = await fetchWithAuth(`/api/trips?${params.toString()}`);
+            trips.push(...(page.trips || []));
+            cursor = page.next_cursor;
+        } while (cursor);
+        return { trips };
     },
 
     getById: (tripId) => fetchWithAuth(`/api/trips/${tripId}`),